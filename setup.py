@@ -12,7 +12,8 @@ setup(
         "torch",
         "openvino",
         "usearch",
-        "numpy"
+        "numpy",
+        "scipy"
     ],
     entry_points={
         "console_scripts": [
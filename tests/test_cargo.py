@@ -0,0 +1,43 @@
+import json
+import numpy as np
+
+from xaptns.cargo import CargoCrane
+from xaptns.search import VectorIndex
+
+DIM = 8
+
+class FakeEmbedder:
+    def embed_stream(self, texts):
+        for i, _ in enumerate(texts):
+            yield i, np.full(DIM, i + 1, dtype=np.float32)
+
+def _kaggle_file(path, n):
+    with open(path, "w") as f:
+        for i in range(n):
+            f.write(json.dumps({"id": f"2101.{i:05d}", "title": f"Paper {i}", "abstract": "Text",
+                                "categories": "cs.LG", "update_date": "2021-01-01"}) + "\n")
+
+def test_failed_write_is_not_checkpointed(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "arxiv.json")
+    _kaggle_file(file_path, 6)
+    vindex = VectorIndex(dim=DIM, db_path=str(tmp_path / "papers.db"))
+    crane = CargoCrane(data_dir=str(tmp_path))
+    add_many = vindex.add_many
+    calls = []
+
+    def failing_add_many(*args, **kwargs):
+        calls.append(1)
+        return False if len(calls) == 2 else add_many(*args, **kwargs)
+
+    monkeypatch.setattr(vindex, "add_many", failing_add_many)
+    stats = crane.ingest(file_path, vindex, FakeEmbedder(), batch_size=2)
+    assert stats["written"] == 2
+    assert stats["failed"] == 2
+    assert len(vindex) == 2
+
+    # The resumed run picks up the failed batch and everything after it
+    monkeypatch.setattr(vindex, "add_many", add_many)
+    stats = crane.ingest(file_path, vindex, FakeEmbedder(), batch_size=2)
+    assert stats["read"] == 4
+    assert stats["written"] == 4
+    assert len(vindex) == 6
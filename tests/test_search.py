@@ -0,0 +1,61 @@
+import json
+import sqlite3
+import numpy as np
+import pytest
+
+from xaptns.search import VectorIndex
+
+DIM = 8
+
+def _vectors(n, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+def _legacy_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE papers (id INTEGER PRIMARY KEY AUTOINCREMENT, arxiv_id TEXT UNIQUE, metadata TEXT, vector BLOB)")
+    metadata = {"title": "Old paper", "authors": ["Ada Lovelace", "Alan Turing"], "categories": ["cs.LG", "stat.ML"], "year": "2020"}
+    conn.execute("INSERT INTO papers (arxiv_id, metadata, vector) VALUES (?, ?, ?)",
+                 ("2001.00001", json.dumps(metadata), _vectors(1)[0].tobytes()))
+    conn.commit()
+    conn.close()
+
+def test_read_only_legacy_db_needs_migration(tmp_path):
+    db_path = str(tmp_path / "legacy.db")
+    _legacy_db(db_path)
+    with pytest.raises(RuntimeError, match="needs migration"):
+        VectorIndex(dim=DIM, db_path=db_path, read_only=True)
+
+def test_migrated_legacy_db_opens_read_only(tmp_path):
+    db_path = str(tmp_path / "legacy.db")
+    _legacy_db(db_path)
+    VectorIndex(dim=DIM, db_path=db_path).close()
+
+    vindex = VectorIndex(dim=DIM, db_path=db_path, read_only=True)
+    metadata = vindex.get_metadata(["2001.00001"])["2001.00001"]
+    assert metadata["authors"] == ["Ada Lovelace", "Alan Turing"]
+    assert metadata["categories"] == ["cs.LG", "stat.ML"]
+    assert metadata["year"] == 2020
+    hits = vindex.search(_vectors(1)[0], limit=1, where={"categories": ["stat.ML"], "authors": "Turing"})
+    assert [h["arxiv_id"] for h in hits] == ["2001.00001"]
+
+def test_unparseable_year_is_stored_as_null(tmp_path):
+    vindex = VectorIndex(dim=DIM, db_path=str(tmp_path / "papers.db"))
+    vindex.add_many(["a", "b"], _vectors(2), [{"year": "n.d."}, {"year": 2021}])
+    metadata = vindex.get_metadata(["a", "b"])
+    assert "year" not in metadata["a"]
+    assert metadata["b"]["year"] == 2021
+
+def test_empty_where_takes_unfiltered_path(tmp_path, monkeypatch):
+    vindex = VectorIndex(dim=DIM, db_path=str(tmp_path / "papers.db"))
+    vindex.add_many(["a", "b", "c"], _vectors(3))
+    monkeypatch.setattr(vindex, "_search_filtered", lambda *args, **kwargs: pytest.fail("filtered path taken"))
+    where = {"categories": [], "year_min": None, "year_max": None, "authors": None}
+    hits = vindex.search(_vectors(1, seed=1)[0], limit=3, where=where)
+    assert len(hits) == 3
+
+def test_author_filter_matches_wildcards_literally(tmp_path):
+    vindex = VectorIndex(dim=DIM, db_path=str(tmp_path / "papers.db"))
+    vindex.add_many(["a", "b"], _vectors(2), [{"authors": ["Jane_Doe"]}, {"authors": ["JaneXDoe"]}])
+    hits = vindex.search(_vectors(1, seed=1)[0], limit=2, where={"authors": "Jane_Doe"})
+    assert [h["arxiv_id"] for h in hits] == ["a"]
+    assert vindex.search(_vectors(1, seed=1)[0], limit=2, where={"authors": "%"}) == []
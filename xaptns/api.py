@@ -1,18 +1,24 @@
 from fastapi import FastAPI, HTTPException, Query
 from typing import List, Optional
 from pydantic import BaseModel
-from xaptns.ingestion import fetch_arxiv_data
+from xaptns.ingestion import fetch_arxiv_data, fetch_arxiv_data_many
+from xaptns.http_cache import default_cache
 from xaptns.model import Embedder
 from xaptns.search import VectorIndex
+from xaptns.shards import ShardedVectorIndex
 from xaptns.navigator import Navigator
 from xaptns.cartographer import Cartographer
 from xaptns.concepts import ConceptMapper
+from xaptns.batching import EmbeddingService
 import numpy as np
+import asyncio
+import os
 
 app = FastAPI(title="Xaptns API", description="High-performance engine for navigating scientific literature.")
 
 # Global state
 embedder = None
+embed_service = None
 vindex = None
 nav = None
 carto = None
@@ -20,13 +26,32 @@ mapper = None
 
 @app.on_event("startup")
 async def startup_event():
-    global embedder, vindex, nav, carto, mapper
+    global embedder, embed_service, vindex, nav, carto, mapper
     embedder = Embedder()
-    vindex = VectorIndex()
+    # Load the model now rather than on the first request
+    embedder.load()
+    # Concurrent /search requests share model batches; tune with these two knobs
+    embed_service = EmbeddingService(
+        embedder,
+        max_batch_size=int(os.environ.get("XAPTNS_EMBED_BATCH_SIZE", 32)),
+        max_wait_ms=float(os.environ.get("XAPTNS_EMBED_MAX_WAIT_MS", 5))
+    )
+    embed_service.start()
+    # Point XAPTNS_SHARD_DIR at a shard directory to serve a ShardedVectorIndex instead of one database
+    shard_dir = os.environ.get("XAPTNS_SHARD_DIR")
+    vindex = ShardedVectorIndex(shard_dir) if shard_dir else VectorIndex()
     nav = Navigator(vindex)
     carto = Cartographer(vindex)
     mapper = ConceptMapper()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if embed_service is not None:
+        await embed_service.stop()
+    # Persist vectors added while serving so the next start skips the rebuild
+    if vindex is not None:
+        vindex.close()
+
 class PaperMetadata(BaseModel):
     id: str
     title: str
@@ -37,20 +62,41 @@ class SearchResponse(BaseModel):
     seed_id: str
     results: List[PaperMetadata]
 
+class CentroidResponse(BaseModel):
+    ids: List[str]
+    results: List[PaperMetadata]
+
+class CentroidQuery(BaseModel):
+    ids: List[str]
+    weights: Optional[List[float]] = None
+
+class CentroidsRequest(BaseModel):
+    queries: List[CentroidQuery]
+    limit: int = 10
+
+class CentroidsResponse(BaseModel):
+    results: List[CentroidResponse]
+
 @app.get("/search", response_model=SearchResponse)
-async def search(id: str, limit: int = 10):
+async def search(id: str, limit: int = 10,
+                 category: Optional[List[str]] = Query(None, description="Only papers in any of these arXiv categories."),
+                 year_min: Optional[int] = None, year_max: Optional[int] = None,
+                 author: Optional[str] = Query(None, description="Only papers with an author matching this name.")):
     """Find similar papers to a given arXiv ID."""
-    paper = fetch_arxiv_data(id)
+    paper = await asyncio.to_thread(fetch_arxiv_data, id)
     if not paper:
         raise HTTPException(status_code=404, detail="Paper not found")
 
     text = f"{paper['title']} {paper['abstract']}"
-    vec = embedder.embed(text)
+    vec = await embed_service.embed(text)
 
     # For MVP, we might want to add this paper to the index if it's not there
-    vindex.add(id, vec, {"title": paper['title'], "abstract": paper['abstract']})
+    await asyncio.to_thread(vindex.add, id, vec, {"title": paper['title'], "abstract": paper['abstract'],
+                                                  "authors": paper['authors'], "categories": paper['categories'],
+                                                  "year": paper['year']})
 
-    matches = vindex.search(vec, limit=limit)
+    where = {"categories": category, "year_min": year_min, "year_max": year_max, "authors": author}
+    matches = await asyncio.to_thread(vindex.search, vec, limit=limit, fields=["title", "abstract"], where=where)
 
     results = []
     for m in matches:
@@ -63,12 +109,65 @@ async def search(id: str, limit: int = 10):
 
     return SearchResponse(seed_id=id, results=results)
 
+async def _centroid_vectors(ids):
+    """
+    Vectors for ids: stored ones in one index query, the rest fetched from
+    arXiv, embedded together and added to the index.
+    """
+    vectors = await asyncio.to_thread(vindex.get_vectors, ids)
+    missing = [aid for aid in dict.fromkeys(ids) if aid not in vectors]
+    if missing:
+        papers = await asyncio.to_thread(fetch_arxiv_data_many, missing)
+        found = [aid for aid in missing if aid in papers]
+        if found:
+            new_vectors = await asyncio.gather(*[
+                embed_service.embed(f"{papers[aid]['title']} {papers[aid]['abstract']}") for aid in found
+            ])
+            metadatas = [{"title": papers[aid]['title'], "abstract": papers[aid]['abstract'],
+                          "authors": papers[aid]['authors'], "categories": papers[aid]['categories'],
+                          "year": papers[aid]['year']} for aid in found]
+            await asyncio.to_thread(vindex.add_many, found, np.stack(new_vectors), metadatas)
+            vectors.update(zip(found, new_vectors))
+    return vectors
+
+async def _search_centroids(queries, limit):
+    vectors = await _centroid_vectors([aid for q in queries for aid in q.ids])
+    try:
+        answers = await asyncio.to_thread(nav.search_centroids, [q.ids for q in queries], vectors,
+                                          [q.weights for q in queries], limit=limit, fields=["title", "abstract"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return [CentroidResponse(ids=used, results=[
+                PaperMetadata(id=m['arxiv_id'], title=m['metadata'].get('title', 'Unknown'),
+                              abstract=m['metadata'].get('abstract', ''), distance=m['distance'])
+                for m in matches])
+            for used, matches in answers]
+
+@app.get("/centroid", response_model=CentroidResponse)
+async def centroid(ids: List[str] = Query(..., description="arXiv IDs whose thematic center to search around."),
+                   weights: Optional[List[float]] = Query(None, description="One weight per ID, in the same order."),
+                   limit: int = 10):
+    """Find papers near the centroid of several arXiv papers."""
+    response = (await _search_centroids([CentroidQuery(ids=ids, weights=weights)], limit))[0]
+    if not response.ids:
+        raise HTTPException(status_code=404, detail="None of the papers were found")
+    return response
+
+@app.post("/centroids", response_model=CentroidsResponse)
+async def centroids(request: CentroidsRequest):
+    """Answer several centroid queries with one batched index search."""
+    return CentroidsResponse(results=await _search_centroids(request.queries, request.limit))
+
 @app.get("/hardware")
 async def get_hardware():
     """Returns information about the detected acceleration hardware."""
     return {
         "device": embedder.device,
-        "acceleration": "OpenVINO/ONNX" if embedder.ort_session or embedder.ov_compiled_model else "CPU"
+        "acceleration": ("ONNX Runtime INT8" if embedder.device == "cpu" and embedder.ort_session
+                         else "OpenVINO/ONNX" if embedder.ort_session or embedder.ov_compiled_model else "CPU"),
+        "embedding_cache": embedder.cache.stats() if embedder.cache else None,
+        "embedding_batches": embed_service.stats(),
+        "http_cache": default_cache().stats()
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,109 @@
+import asyncio
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+class EmbeddingService:
+    """
+    Async micro-batching front end for an Embedder. Concurrent requests
+    enqueue their texts; a background worker coalesces them into one batch
+    of up to max_batch_size texts, waiting at most max_wait_ms after the
+    first arrival, and runs inference on a dedicated thread so the event
+    loop never blocks on the model.
+    """
+    def __init__(self, embedder, max_batch_size=32, max_wait_ms=5.0):
+        self.embedder = embedder
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.batch_sizes = Counter()
+        self._queue = None
+        self._worker = None
+        # One inference thread: batches run back to back, never concurrently
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedder")
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown()
+
+    async def embed(self, text):
+        """
+        Embeds one text as part of whatever batch it lands in.
+        Returns a 1-D vector.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _next_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            # Requests cancelled while queued (e.g. client disconnects) are dropped
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+            self.batch_sizes[len(batch)] += 1
+            try:
+                vectors = await loop.run_in_executor(self._executor, self.embedder.embed, [t for t, _ in batch])
+            except Exception as e:
+                print(f"Error in batched embedding: {e}", file=sys.stderr)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), vec in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vec)
+
+    def stats(self):
+        """
+        Achieved batch sizes, for tuning max_batch_size against max_wait_ms.
+        """
+        batches = sum(self.batch_sizes.values())
+        texts = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "batches": batches,
+            "texts": texts,
+            "mean_batch_size": texts / batches if batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+        }
+
+if __name__ == "__main__":
+    class _EchoEmbedder:
+        def embed(self, texts):
+            return np.array([[float(len(t))] for t in texts], dtype=np.float32)
+
+    async def _demo():
+        service = EmbeddingService(_EchoEmbedder(), max_batch_size=8, max_wait_ms=5)
+        service.start()
+        vectors = await asyncio.gather(*[service.embed("x" * i) for i in range(20)])
+        print(f"Embedded {len(vectors)} texts: {service.stats()}")
+        await service.stop()
+
+    asyncio.run(_demo())
@@ -0,0 +1,136 @@
+import sqlite3
+import subprocess
+import sys
+import time
+import numpy as np
+from usearch.index import Index
+from xaptns.exact import ExactIndex
+from typing import List, Dict, Any, Sequence
+
+# Modules that must not load just to start the CLI
+HEAVY_MODULES = ("torch", "transformers", "openvino", "onnxruntime", "ripser", "persim", "networkx", "arxiv")
+
+def check_import_time(module: str = "xaptns.cli", budget_s: float = 1.0) -> Dict[str, Any]:
+    """
+    Imports module in a fresh interpreter under `python -X importtime` and
+    checks it against a startup budget: the cumulative import time must stay
+    under budget_s and none of HEAVY_MODULES may be pulled in.
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr}")
+
+    timings = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings.append((name.strip(), int(cumulative) / 1e6))
+
+    total = max((t for name, t in timings if name == module), default=0.0)
+    heavy = sorted({name for name, _ in timings if name.split(".")[0] in HEAVY_MODULES})
+    return {
+        "module": module,
+        "total_s": total,
+        "budget_s": budget_s,
+        "heavy_imports": heavy,
+        "ok": total <= budget_s and not heavy,
+        "slowest": sorted(timings, key=lambda x: x[1], reverse=True)[:10],
+    }
+
+def synthetic_corpus(num_papers: int, dim: int = 768, num_clusters: int = 100, seed: int = 0) -> np.ndarray:
+    """
+    Clustered Gaussian vectors, which give HNSW a more realistic neighborhood
+    structure than uniform noise.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, num_clusters, size=num_papers)
+    return centers[labels] + 0.5 * rng.standard_normal((num_papers, dim)).astype(np.float32)
+
+def load_corpus(db_path: str = "xaptns.db") -> np.ndarray:
+    """
+    Loads every stored paper vector from a Xaptns database.
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    rows = conn.execute("SELECT vector FROM paper_vectors ORDER BY id").fetchall()
+    conn.close()
+    if not rows:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.stack([np.frombuffer(row[0], dtype=np.float32) for row in rows])
+
+def _measure(index, queries: np.ndarray, k: int) -> Dict[str, Any]:
+    """
+    Per-query latency percentiles from single-query calls, and QPS from one batch call.
+    """
+    latencies = []
+    for q in queries:
+        started = time.perf_counter()
+        index.search(q.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    matches = index.search(queries, k)
+    batch_seconds = time.perf_counter() - started
+
+    return {
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "qps": len(queries) / batch_seconds if batch_seconds > 0 else float("inf"),
+        "keys": np.asarray(matches.keys).reshape(len(queries), -1)[:, :k],
+    }
+
+def benchmark_backends(vectors: np.ndarray, k: int = 10, num_queries: int = 200,
+                       connectivities: Sequence[int] = (16, 32), expansions: Sequence[int] = (32, 64, 128),
+                       dtype: str = "i8", seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Builds the exact brute-force backend and HNSW indexes over the given
+    vectors and reports build time, p50/p99 query latency, QPS and recall@k
+    (against the exact results) for every connectivity/expansion_search pair.
+    Queries are perturbed copies of corpus vectors.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    k = min(k, n)
+    keys = np.arange(n, dtype=np.uint64)
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(n, size=min(num_queries, n), replace=False)]
+    queries = queries + 0.1 * queries.std() * rng.standard_normal(queries.shape).astype(np.float32)
+
+    report = []
+    started = time.perf_counter()
+    exact = ExactIndex(dim)
+    exact.add(keys, vectors)
+    build_seconds = time.perf_counter() - started
+    stats = _measure(exact, queries, k)
+    truth = stats.pop("keys")
+    report.append({"backend": "exact", "connectivity": None, "expansion_search": None,
+                   "build_s": build_seconds, "recall": 1.0, **stats})
+
+    for connectivity in connectivities:
+        started = time.perf_counter()
+        hnsw = Index(ndim=dim, metric='cos', dtype=dtype, connectivity=connectivity)
+        hnsw.add(keys, vectors)
+        build_seconds = time.perf_counter() - started
+        for expansion in expansions:
+            hnsw.expansion_search = expansion
+            stats = _measure(hnsw, queries, k)
+            found = stats.pop("keys")
+            recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+            report.append({"backend": "hnsw", "connectivity": connectivity, "expansion_search": expansion,
+                           "build_s": build_seconds, "recall": float(recall), **stats})
+    return report
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["importtime"]:
+        result = check_import_time()
+        print(f"import {result['module']}: {result['total_s']:.3f}s (budget {result['budget_s']:.1f}s)")
+        for name, seconds in result["slowest"]:
+            print(f"  {seconds:.3f}s  {name}")
+        if not result["ok"]:
+            print(f"FAILED: over budget or heavy imports {result['heavy_imports']}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        for row in benchmark_backends(synthetic_corpus(5000, dim=64), k=10, num_queries=50):
+            print(row)
@@ -1,16 +1,59 @@
+import itertools
 import json
 import os
+import random
+import sqlite3
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 import requests
-from typing import List, Dict, Any
+from requests.adapters import HTTPAdapter
+from xaptns.http_cache import HTTPCache, default_cache
+from xaptns.ingestion import normalize_arxiv_id
+from xaptns.citations import CitationGraph, paper_key
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+# Records looked up, embedded and written per batch during ingest
+INGEST_BATCH_SIZE = 256
+# Written records between progress reports
+PROGRESS_INTERVAL = 10000
+
+OPENALEX_URL = "https://api.openalex.org"
+# arXiv IDs per OpenAlex OR-filter query (the API allows up to 100 values)
+OPENALEX_CHUNK_SIZE = 50
+# Concurrent OpenAlex requests
+OPENALEX_MAX_WORKERS = 8
+# OpenAlex allows 10 requests/second per client
+OPENALEX_REQUESTS_PER_SECOND = 10
+OPENALEX_MAX_RETRIES = 5
+OPENALEX_FIELDS = "id,doi,cited_by_count,referenced_works,concepts"
 
 class CargoCrane:
     """
     The Cargo Crane: Ingestion scripts for bulk arXiv data and Semantic Scholar/OpenAlex enrichment.
     """
-    def __init__(self, data_dir: str = "data"):
+    def __init__(self, data_dir: str = "data", openalex_url: str = OPENALEX_URL, mailto: Optional[str] = None,
+                 max_workers: int = OPENALEX_MAX_WORKERS, requests_per_second: float = OPENALEX_REQUESTS_PER_SECOND,
+                 http_cache: Optional[HTTPCache] = None):
         self.data_dir = data_dir
+        self.http_cache = http_cache or default_cache()
         os.makedirs(data_dir, exist_ok=True)
+        self.openalex_url = openalex_url.rstrip("/")
+        # Identifies us for OpenAlex's "polite pool"
+        self.mailto = mailto or os.environ.get("OPENALEX_MAILTO")
+        self.max_workers = max_workers
+
+        # One pooled session for every OpenAlex call, sized for the worker threads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._min_interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._next_request_at = 0.0
+        self._rate_lock = threading.Lock()
+        self.request_stats = {"requests": 0, "retries": 0, "failures": 0}
 
     def process_kaggle_batch(self, file_path: str, limit: int = 100000):
         """
@@ -20,33 +63,422 @@ class CargoCrane:
             print(f"Error: {file_path} not found.", file=sys.stderr)
             return []
 
-        papers = []
-        with open(file_path, 'r') as f:
-            for i, line in enumerate(f):
-                if i >= limit:
+        return [record for _, record in itertools.islice(self.iter_kaggle(file_path), limit)]
+
+    def iter_kaggle(self, file_path: str, start_offset: int = 0,
+                    stats: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Streams (end_offset, record) pairs from the Kaggle JSONL file, starting
+        at a byte offset. end_offset is where the next record begins, which is
+        what a checkpoint stores. Malformed lines are counted and skipped.
+        """
+        offset = start_offset
+        with open(file_path, 'rb') as f:
+            f.seek(start_offset)
+            for line in f:
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    if stats is not None:
+                        stats["malformed"] += 1
+                    continue
+                yield offset, record
+
+    @staticmethod
+    def kaggle_metadata(record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Maps a Kaggle arXiv record onto the VectorIndex metadata fields.
+        """
+        year = None
+        versions = record.get("versions") or []
+        if versions and versions[0].get("created"):
+            # e.g. "Mon, 2 Apr 2007 19:18:42 GMT"
+            parts = versions[0]["created"].split()
+            year = int(parts[3]) if len(parts) > 3 and parts[3].isdigit() else None
+        if year is None and record.get("update_date"):
+            year = int(record["update_date"][:4])
+
+        authors = [" ".join(p for p in (a[1], a[0]) if p) for a in record.get("authors_parsed") or []]
+        return {
+            "title": " ".join((record.get("title") or "").split()),
+            "abstract": " ".join((record.get("abstract") or "").split()),
+            "authors": authors,
+            "year": year,
+            "categories": (record.get("categories") or "").split(),
+            "doi": record.get("doi"),
+        }
+
+    def _load_checkpoint(self, checkpoint_path: str, file_path: str) -> int:
+        """
+        Returns the byte offset to resume file_path from, or 0.
+        """
+        if not os.path.exists(checkpoint_path):
+            return 0
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("file") != os.path.abspath(file_path) or checkpoint.get("offset", 0) > os.path.getsize(file_path):
+            print(f"Warning: Checkpoint {checkpoint_path} does not match {file_path}; starting from the beginning.",
+                  file=sys.stderr)
+            return 0
+        return checkpoint["offset"]
+
+    def _save_checkpoint(self, checkpoint_path: str, file_path: str, offset: int, stats: Dict[str, Any]):
+        tmp_path = checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"file": os.path.abspath(file_path), "offset": offset, "written": stats["written"]}, f)
+        os.replace(tmp_path, checkpoint_path)
+
+    def ingest(self, file_path: str, vector_index, embedder, batch_size: int = INGEST_BATCH_SIZE,
+               limit: Optional[int] = None, resume: bool = True, checkpoint_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Streams the Kaggle JSONL file into a VectorIndex: parse, skip papers
+        already stored, embed, and bulk-write, one batch at a time, without
+        holding the file in memory. Reading and lookups run inside the
+        embedder's tokenizer stage, so they overlap with inference.
+
+        After every written batch the index is committed and the byte offset
+        up to which every record is stored is checkpointed, so a crashed run
+        resumes there. A batch that fails to write stops the run without
+        moving the checkpoint past it. limit caps the number of records read
+        in this run. Returns counts, per-stage seconds and records/sec.
+        """
+        if not os.path.exists(file_path):
+            print(f"Error: {file_path} not found.", file=sys.stderr)
+            return {}
+        checkpoint_path = checkpoint_path or os.path.join(self.data_dir, os.path.basename(file_path) + ".checkpoint.json")
+        start_offset = self._load_checkpoint(checkpoint_path, file_path) if resume else 0
+        if start_offset:
+            print(f"Resuming {file_path} from byte {start_offset}...", file=sys.stderr)
+
+        stats = {"read": 0, "malformed": 0, "skipped": 0, "embedded": 0, "written": 0, "failed": 0,
+                 "seconds": {"parse": 0.0, "lookup": 0.0, "embed": 0.0, "write": 0.0}}
+        pending = {}  # stream index -> (arxiv_id, metadata, end_offset)
+        reached = {"offset": start_offset}
+
+        def new_texts():
+            # Runs on the embedder's tokenizer thread when it has one
+            records = itertools.islice(self.iter_kaggle(file_path, start_offset, stats), limit)
+            index = 0
+            while True:
+                started = time.perf_counter()
+                raw = list(itertools.islice(records, batch_size))
+                if not raw:
+                    return
+                batch = [(end, rec["id"], self.kaggle_metadata(rec)) for end, rec in raw if rec.get("id")]
+                parsed = time.perf_counter()
+                stats["seconds"]["parse"] += parsed - started
+                existing = vector_index.contains([aid for _, aid, _ in batch])
+                stats["seconds"]["lookup"] += time.perf_counter() - parsed
+                stats["read"] += len(batch)
+                for end, aid, meta in batch:
+                    if aid in existing:
+                        stats["skipped"] += 1
+                        continue
+                    pending[index] = (aid, meta, end)
+                    index += 1
+                    yield f"{meta['title']} {meta['abstract']}"
+                reached["offset"] = raw[-1][0]
+
+        buffer = []
+        done = set()
+        written_upto = 0
+        checkpoint_offset = start_offset
+        next_progress = PROGRESS_INTERVAL
+
+        def write_buffer():
+            nonlocal written_upto, checkpoint_offset, next_progress
+            if not buffer:
+                return True
+            started = time.perf_counter()
+            stored = vector_index.add_many([pending[i][0] for i, _ in buffer], np.stack([v for _, v in buffer]),
+                                           [pending[i][1] for i, _ in buffer])
+            if not stored:
+                stats["failed"] += len(buffer)
+                stats["seconds"]["write"] += time.perf_counter() - started
+                return False
+            vector_index.flush()
+            stats["written"] += len(buffer)
+            done.update(i for i, _ in buffer)
+            buffer.clear()
+            # Only the prefix in which every record is stored may be checkpointed
+            while written_upto in done:
+                done.discard(written_upto)
+                checkpoint_offset = pending.pop(written_upto)[2]
+                written_upto += 1
+            self._save_checkpoint(checkpoint_path, file_path, checkpoint_offset, stats)
+            stats["seconds"]["write"] += time.perf_counter() - started
+            if stats["written"] >= next_progress:
+                next_progress += PROGRESS_INTERVAL
+                print(f"Ingested {stats['written']} papers ({stats['skipped']} already stored)...", file=sys.stderr)
+            return True
+
+        started = time.perf_counter()
+        waited = time.perf_counter()
+        embed_wait = 0.0
+        stored = True
+        stream = embedder.embed_stream(new_texts())
+        for i, vec in stream:
+            embed_wait += time.perf_counter() - waited
+            stats["embedded"] += 1
+            buffer.append((i, vec))
+            if len(buffer) >= batch_size:
+                stored = write_buffer()
+                if not stored:
                     break
-                papers.append(json.loads(line))
-        return papers
+            waited = time.perf_counter()
+        stream.close()
+        if stored:
+            stored = write_buffer()
+        if stored:
+            # Everything read has been stored or skipped; trailing skipped records are done too
+            self._save_checkpoint(checkpoint_path, file_path, max(checkpoint_offset, reached["offset"]), stats)
+        else:
+            print(f"Error: Writing a batch to the index failed; stopping with {file_path} checkpointed "
+                  f"at byte {checkpoint_offset}.", file=sys.stderr)
+        stats["seconds"]["total"] = time.perf_counter() - started
+
+        # Pipelined embedders report pure inference time; otherwise count time spent waiting on them
+        stream_stats = getattr(embedder, "stream_stats", None) or {}
+        stats["seconds"]["embed"] = stream_stats.get("infer_busy_s", embed_wait)
+        counts = {"parse": stats["read"], "lookup": stats["read"], "embed": stats["embedded"], "write": stats["written"],
+                  "total": stats["written"]}
+        stats["records_per_s"] = {stage: counts[stage] / seconds if seconds > 0 else 0.0
+                                  for stage, seconds in stats["seconds"].items()}
+        return stats
 
     def enrich_with_openalex(self, arxiv_id: str) -> Dict[str, Any]:
         """
         Enriches a paper with OpenAlex citation counts and reference lists.
         """
-        # OpenAlex API endpoint for arXiv IDs
-        url = f"https://api.openalex.org/works/https://arxiv.org/abs/{arxiv_id}"
         try:
-            response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    "citation_count": data.get("cited_by_count", 0),
-                    "referenced_works": data.get("referenced_works", []),
-                    "concepts": data.get("concepts", [])
-                }
+            return self._fetch_openalex_chunk([arxiv_id]).get(normalize_arxiv_id(arxiv_id), {})
         except Exception as e:
             print(f"Error enriching with OpenAlex for {arxiv_id}: {e}", file=sys.stderr)
         return {}
 
+    def _throttle(self):
+        """
+        Spaces requests from all threads at least 1/requests_per_second apart.
+        """
+        with self._rate_lock:
+            now = time.monotonic()
+            wait = self._next_request_at - now
+            self._next_request_at = max(now, self._next_request_at) + self._min_interval
+            self.request_stats["requests"] += 1
+        if wait > 0:
+            time.sleep(wait)
+
+    def _get_json(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Cached GET; misses go to the network through _request_json.
+        """
+        key = HTTPCache.normalize_url(url, params)
+        _, data = self.http_cache.fetch(key, "openalex", lambda: (200, self._request_json(url, params)))
+        return data
+
+    def _request_json(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        GET with retries: 429 and 5xx responses and connection errors are
+        retried with exponential backoff and jitter, honoring Retry-After.
+        """
+        for attempt in range(OPENALEX_MAX_RETRIES + 1):
+            self._throttle()
+            delay = min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+            try:
+                response = self.session.get(url, params=params, timeout=30)
+            except requests.RequestException as e:
+                error = e
+            else:
+                if response.status_code == 200:
+                    return response.json()
+                error = requests.HTTPError(f"OpenAlex returned {response.status_code}", response=response)
+                if response.status_code != 429 and response.status_code < 500:
+                    break
+                retry_after = response.headers.get("Retry-After")
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+            if attempt < OPENALEX_MAX_RETRIES:
+                with self._rate_lock:
+                    self.request_stats["retries"] += 1
+                time.sleep(delay)
+        with self._rate_lock:
+            self.request_stats["failures"] += 1
+        raise error
+
+    def _fetch_openalex_chunk(self, arxiv_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Looks up several papers in one OpenAlex query by OR-ing their arXiv
+        DOIs (10.48550/arXiv.<id>). Returns {arxiv_id: enrichment} for the
+        papers OpenAlex knows.
+        """
+        by_doi = {}
+        for aid in arxiv_ids:
+            clean_id = normalize_arxiv_id(aid)
+            by_doi[f"10.48550/arxiv.{clean_id}".lower()] = clean_id
+        params = {"filter": "doi:" + "|".join(by_doi), "select": OPENALEX_FIELDS, "per-page": len(by_doi)}
+        if self.mailto:
+            params["mailto"] = self.mailto
+        data = self._get_json(f"{self.openalex_url}/works", params)
+
+        found = {}
+        for work in data.get("results", []):
+            doi = (work.get("doi") or "").lower().replace("https://doi.org/", "")
+            if doi in by_doi:
+                found[by_doi[doi]] = {
+                    "openalex_id": work.get("id"),
+                    "citation_count": work.get("cited_by_count", 0),
+                    "referenced_works": work.get("referenced_works", []),
+                    "concepts": work.get("concepts", [])
+                }
+        return found
+
+    def _fetch_work_dois(self, work_ids: List[str]) -> Dict[str, Optional[str]]:
+        """
+        DOIs of several OpenAlex works in one OR-filter query, as {work id: DOI or None}.
+        """
+        short_ids = [w.rsplit("/", 1)[-1] for w in work_ids]
+        params = {"filter": "ids.openalex:" + "|".join(short_ids), "select": "id,doi", "per-page": len(short_ids)}
+        if self.mailto:
+            params["mailto"] = self.mailto
+        data = self._get_json(f"{self.openalex_url}/works", params)
+        return {work.get("id"): work.get("doi") for work in data.get("results", [])}
+
+    def _open_enrichment_db(self, db_path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS openalex_works (
+                arxiv_id TEXT PRIMARY KEY,
+                openalex_id TEXT,
+                citation_count INTEGER,
+                referenced_works TEXT,
+                concepts TEXT,
+                fetched_at REAL
+            )
+        ''')
+        conn.commit()
+        return conn
+
+    def _reference_keys(self, conn: sqlite3.Connection, found: Dict[str, Dict[str, Any]]) -> Dict[str, List[Tuple[str, None]]]:
+        """
+        Citation graph reference lists for enriched papers. Referenced works
+        that are themselves enriched arXiv papers map to their arXiv node;
+        the rest are keyed by OpenAlex ID and resolve through the graph's
+        aliases once their arXiv ID or DOI is known.
+        """
+        works = list({w for work in found.values() for w in work["referenced_works"]})
+        arxiv_by_work = {}
+        for start in range(0, len(works), 900):
+            chunk = works[start:start + 900]
+            arxiv_by_work.update(conn.execute(
+                f"SELECT openalex_id, arxiv_id FROM openalex_works WHERE openalex_id IN ({','.join(['?'] * len(chunk))})",
+                chunk
+            ).fetchall())
+        return {
+            paper_key(arxiv_id=aid): [(paper_key(arxiv_id=arxiv_by_work.get(w), openalex_id=w), None)
+                                      for w in work["referenced_works"]]
+            for aid, work in found.items()
+        }
+
+    def _resolve_references(self, graph: CitationGraph, work_ids: set, chunk_size: int,
+                            executor: ThreadPoolExecutor) -> int:
+        """
+        Aliases referenced OpenAlex works to their arXiv or DOI node. Works
+        already resolved, or without a DOI, are left as OpenAlex nodes.
+        Returns the number of works aliased.
+        """
+        keys = {paper_key(openalex_id=w): w for w in work_ids}
+        pending = [w for key, w in keys.items() if key not in graph.aliased(keys)]
+        chunks = [pending[start:start + chunk_size] for start in range(0, len(pending), chunk_size)]
+        resolved = 0
+        futures = {executor.submit(self._fetch_work_dois, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            try:
+                dois = future.result()
+            except Exception as e:
+                print(f"Error resolving {len(futures[future])} referenced works with OpenAlex: {e}", file=sys.stderr)
+                continue
+            aliases = {paper_key(openalex_id=w): paper_key(doi=doi) for w, doi in dois.items() if w and doi}
+            graph.add_aliases(aliases)
+            resolved += len(aliases)
+        return resolved
+
+    def enrich_many(self, arxiv_ids: List[str], db_path: str = "xaptns.db", chunk_size: int = OPENALEX_CHUNK_SIZE,
+                    refresh: bool = False, resolve_references: bool = True) -> Dict[str, Any]:
+        """
+        Bulk OpenAlex enrichment. IDs are grouped into multi-ID filter queries,
+        which run concurrently (up to max_workers) over the pooled session,
+        rate-limited and retried. Citation counts, referenced works and
+        concepts go to the openalex_works table, one transaction per chunk.
+        Papers already enriched are skipped unless refresh=True. Referenced
+        works are also stored as citation edges (see CitationGraph).
+
+        Each enriched work's OpenAlex ID becomes an alias of its arXiv node.
+        With resolve_references=True, referenced works not yet tied to a
+        canonical key are looked up (DOIs only, chunk_size per query) and
+        aliased to their arXiv or DOI node, so a paper cited through OpenAlex
+        and Semantic Scholar is counted on one node.
+        """
+        started = time.perf_counter()
+        requests_before = dict(self.request_stats)
+        ids = list(dict.fromkeys(normalize_arxiv_id(aid) for aid in arxiv_ids))
+        conn = self._open_enrichment_db(db_path)
+        graph = CitationGraph(db_path)
+        try:
+            done = set()
+            if not refresh:
+                for start in range(0, len(ids), 900):
+                    chunk = ids[start:start + 900]
+                    done.update(row[0] for row in conn.execute(
+                        f"SELECT arxiv_id FROM openalex_works WHERE arxiv_id IN ({','.join(['?'] * len(chunk))})", chunk
+                    ))
+                ids = [aid for aid in ids if aid not in done]
+
+            stats = {"requested": len(ids), "skipped": len(done), "found": 0, "missing": 0, "failed": 0, "resolved": 0}
+            referenced = set()
+            chunks = [ids[start:start + chunk_size] for start in range(0, len(ids), chunk_size)]
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(self._fetch_openalex_chunk, chunk): chunk for chunk in chunks}
+                for future in as_completed(futures):
+                    chunk = futures[future]
+                    try:
+                        found = future.result()
+                    except Exception as e:
+                        print(f"Error enriching {len(chunk)} papers with OpenAlex: {e}", file=sys.stderr)
+                        stats["failed"] += len(chunk)
+                        continue
+                    # All writes happen on this thread
+                    now = time.time()
+                    conn.executemany(
+                        "INSERT INTO openalex_works (arxiv_id, openalex_id, citation_count, referenced_works, concepts, fetched_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(arxiv_id) DO UPDATE SET "
+                        "openalex_id = excluded.openalex_id, citation_count = excluded.citation_count, "
+                        "referenced_works = excluded.referenced_works, concepts = excluded.concepts, "
+                        "fetched_at = excluded.fetched_at",
+                        [(aid, w["openalex_id"], w["citation_count"], json.dumps(w["referenced_works"]),
+                          json.dumps(w["concepts"]), now) for aid, w in found.items()]
+                    )
+                    conn.commit()
+                    graph.add_aliases({paper_key(openalex_id=w["openalex_id"]): paper_key(arxiv_id=aid)
+                                       for aid, w in found.items() if w["openalex_id"]})
+                    graph.add_references(self._reference_keys(conn, found), source="openalex")
+                    referenced.update(w for work in found.values() for w in work["referenced_works"])
+                    stats["found"] += len(found)
+                    stats["missing"] += len(chunk) - len(found)
+
+                if resolve_references and referenced:
+                    stats["resolved"] = self._resolve_references(graph, referenced, chunk_size, executor)
+        finally:
+            graph.close()
+            conn.close()
+
+        stats.update({k: v - requests_before[k] for k, v in self.request_stats.items()})
+        stats["seconds"] = time.perf_counter() - started
+        return stats
+
 if __name__ == "__main__":
     crane = CargoCrane()
     print("Cargo Crane initialized. Use process_kaggle_batch to ingest data.")
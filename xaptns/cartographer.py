@@ -1,6 +1,4 @@
 import numpy as np
-from ripser import ripser
-from persim import plot_diagrams
 from typing import List, Tuple
 
 class Cartographer:
@@ -18,6 +16,8 @@ class Cartographer:
         if len(vectors) < 10:
             return []
 
+        from ripser import ripser
+
         # Calculate persistent homology up to dimension 1 (holes)
         dgms = ripser(vectors, maxdim=1)['dgms']
 
@@ -0,0 +1,319 @@
+import sqlite3
+import threading
+import numpy as np
+
+# scipy is imported when the adjacency is first built, see _adjacency().
+
+SQLITE_MAX_VARIABLES = 999
+ARXIV_DOI_PREFIX = "10.48550/arxiv."
+
+def normalize_doi(doi):
+    """
+    Lowercase DOI without a resolver prefix, or None.
+    """
+    if not doi:
+        return None
+    doi = doi.strip().lower()
+    for prefix in ("https://doi.org/", "http://doi.org/", "doi:"):
+        if doi.startswith(prefix):
+            doi = doi[len(prefix):]
+    return doi or None
+
+def paper_key(arxiv_id=None, s2_id=None, openalex_id=None, doi=None):
+    """
+    Graph node key for a paper: its arXiv ID when known, so the same paper
+    seen through different sources maps to one node, then its DOI, else a
+    source ID. arXiv DOIs (10.48550/arXiv.<id>) map to the arXiv key.
+    """
+    doi = normalize_doi(doi)
+    if not arxiv_id and doi and doi.startswith(ARXIV_DOI_PREFIX):
+        arxiv_id = doi[len(ARXIV_DOI_PREFIX):]
+    if arxiv_id:
+        return f"arxiv:{arxiv_id}"
+    if doi:
+        return f"doi:{doi}"
+    if s2_id:
+        return f"s2:{s2_id}"
+    if openalex_id:
+        return f"openalex:{openalex_id.rsplit('/', 1)[-1]}"
+    return None
+
+class CitationGraph:
+    """
+    Citation edges (citing -> cited, with the source they came from) stored
+    in SQLite and served from a compressed sparse row adjacency matrix A
+    over integer node ids, where A[i, j] = 1 if paper i cites paper j.
+    Co-citation, bibliographic coupling and "most cited by this set" are
+    sparse products on A, so ranking needs no network calls.
+    The matrix is rebuilt lazily after writes.
+
+    A paper first stored under a source ID (e.g. "openalex:W..." or
+    "s2:...") can later be tied to its canonical key with add_aliases():
+    its node is merged into the canonical one, and the alias resolves to
+    that node from then on.
+    """
+    def __init__(self, db_path="xaptns.db"):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._matrix = None
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS citation_nodes (
+                id INTEGER PRIMARY KEY,
+                key TEXT UNIQUE,
+                title TEXT
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS citations (
+                citing INTEGER,
+                cited INTEGER,
+                source TEXT,
+                PRIMARY KEY (citing, cited)
+            ) WITHOUT ROWID
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_citations_cited ON citations(cited)")
+        # Papers whose reference list has been stored, even if it was empty
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS reference_lists (
+                citing INTEGER PRIMARY KEY,
+                source TEXT,
+                num_references INTEGER
+            )
+        ''')
+        # Other keys of a merged paper, pointing at its node
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS node_aliases (
+                alias TEXT PRIMARY KEY,
+                node INTEGER
+            )
+        ''')
+        self.conn.commit()
+
+    def _lookup(self, table, key_column, value_column, keys):
+        found = {}
+        for start in range(0, len(keys), SQLITE_MAX_VARIABLES):
+            chunk = keys[start:start + SQLITE_MAX_VARIABLES]
+            found.update(self.conn.execute(
+                f"SELECT {key_column}, {value_column} FROM {table} WHERE {key_column} IN ({','.join(['?'] * len(chunk))})",
+                chunk
+            ).fetchall())
+        return found
+
+    def _node_ids(self, keys, create=False, titles=None):
+        """
+        Maps node keys (or their aliases) to integer ids, inserting unknown
+        keys when create=True.
+        """
+        keys = list(dict.fromkeys(k for k in keys if k))
+        with self._lock:
+            ids = self._lookup("node_aliases", "alias", "node", keys)
+            rest = [k for k in keys if k not in ids]
+            if create:
+                self.conn.executemany(
+                    "INSERT INTO citation_nodes (key, title) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET title = COALESCE(citation_nodes.title, excluded.title)",
+                    [(k, (titles or {}).get(k)) for k in rest]
+                )
+            ids.update(self._lookup("citation_nodes", "key", "id", rest))
+        return ids
+
+    def add_aliases(self, aliases):
+        """
+        Records that each alias key names the same paper as its canonical
+        key ({alias: canonical}). A node already stored under the alias is
+        merged into the canonical node: its edges and reference lists move
+        over and it is deleted.
+        """
+        aliases = {a: c for a, c in aliases.items() if a and c and a != c}
+        if not aliases:
+            return
+        with self._lock:
+            try:
+                canonical = self._node_ids(aliases.values(), create=True)
+                existing = self._lookup("citation_nodes", "key", "id", list(aliases))
+                for alias, key in aliases.items():
+                    node = existing.get(alias)
+                    if node is not None and node != canonical[key]:
+                        self._merge_node(node, canonical[key])
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO node_aliases (alias, node) VALUES (?, ?)",
+                    [(alias, canonical[key]) for alias, key in aliases.items()]
+                )
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            self._matrix = None
+
+    def aliased(self, keys):
+        """
+        Returns the subset of keys already recorded as aliases.
+        """
+        with self._lock:
+            return set(self._lookup("node_aliases", "alias", "node", list(keys)))
+
+    def _merge_node(self, node, target):
+        """
+        Moves node's edges, reference lists and aliases onto target and deletes it.
+        """
+        # Edges between the two would become self-citations; they are dropped
+        self.conn.execute(
+            "INSERT OR IGNORE INTO citations (citing, cited, source) "
+            "SELECT ?, cited, source FROM citations WHERE citing = ? AND cited != ?", (target, node, target)
+        )
+        self.conn.execute(
+            "INSERT OR IGNORE INTO citations (citing, cited, source) "
+            "SELECT citing, ?, source FROM citations WHERE cited = ? AND citing != ?", (target, node, target)
+        )
+        self.conn.execute("DELETE FROM citations WHERE citing = ? OR cited = ?", (node, node))
+        self.conn.execute(
+            "INSERT OR IGNORE INTO reference_lists (citing, source, num_references) "
+            "SELECT ?, source, num_references FROM reference_lists WHERE citing = ?", (target, node)
+        )
+        self.conn.execute("DELETE FROM reference_lists WHERE citing = ?", (node,))
+        self.conn.execute(
+            "UPDATE citation_nodes SET title = COALESCE(title, (SELECT title FROM citation_nodes WHERE id = ?)) "
+            "WHERE id = ?", (node, target)
+        )
+        self.conn.execute("UPDATE node_aliases SET node = ? WHERE node = ?", (target, node))
+        self.conn.execute("DELETE FROM citation_nodes WHERE id = ?", (node,))
+
+    def add_references(self, references, source):
+        """
+        Stores reference lists. references maps a citing paper key to a list
+        of (cited key, cited title) pairs; a list replaces whatever was stored
+        for that paper from the same source.
+        """
+        titles = {}
+        for refs in references.values():
+            for key, title in refs:
+                if key and title:
+                    titles.setdefault(key, title)
+        all_keys = list(references) + [key for refs in references.values() for key, _ in refs]
+        with self._lock:
+            try:
+                ids = self._node_ids(all_keys, create=True, titles=titles)
+                citing_ids = [ids[k] for k in references if k in ids]
+                self.conn.executemany("DELETE FROM citations WHERE citing = ? AND source = ?",
+                                      [(c, source) for c in citing_ids])
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO citations (citing, cited, source) VALUES (?, ?, ?)",
+                    [(ids[citing], ids[key], source)
+                     for citing, refs in references.items() if citing in ids
+                     for key, _ in refs if key in ids and ids[key] != ids[citing]]
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO reference_lists (citing, source, num_references) VALUES (?, ?, ?)",
+                    [(ids[citing], source, len(refs)) for citing, refs in references.items() if citing in ids]
+                )
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            self._matrix = None
+
+    def has_references(self, keys):
+        """
+        Returns the subset of keys whose reference list is stored.
+        """
+        ids = self._node_ids(keys)
+        stored = set()
+        with self._lock:
+            id_list = list(ids.values())
+            for start in range(0, len(id_list), SQLITE_MAX_VARIABLES):
+                chunk = id_list[start:start + SQLITE_MAX_VARIABLES]
+                stored.update(row[0] for row in self.conn.execute(
+                    f"SELECT citing FROM reference_lists WHERE citing IN ({','.join(['?'] * len(chunk))})", chunk
+                ))
+        return {key for key, node in ids.items() if node in stored}
+
+    def _adjacency(self):
+        """
+        The CSR citation matrix, built from SQLite on first use after a write.
+        """
+        from scipy.sparse import csr_matrix
+        with self._lock:
+            if self._matrix is None:
+                size = self.conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM citation_nodes").fetchone()[0]
+                edges = np.array(self.conn.execute("SELECT citing, cited FROM citations").fetchall(),
+                                 dtype=np.int64).reshape(-1, 2)
+                self._matrix = csr_matrix(
+                    (np.ones(len(edges), dtype=np.float32), (edges[:, 0], edges[:, 1])), shape=(size, size)
+                )
+            return self._matrix
+
+    def _indicator(self, keys):
+        """
+        Node ids of keys present in the graph, in input order, and the keys themselves.
+        """
+        ids = self._node_ids(keys)
+        present = [k for k in dict.fromkeys(keys) if k in ids]
+        return np.array([ids[k] for k in present], dtype=np.int64), present
+
+    def _titles(self, node_ids):
+        node_ids = [int(i) for i in node_ids]
+        titles = {}
+        with self._lock:
+            for start in range(0, len(node_ids), SQLITE_MAX_VARIABLES):
+                chunk = node_ids[start:start + SQLITE_MAX_VARIABLES]
+                titles.update((row[0], row[1:]) for row in self.conn.execute(
+                    f"SELECT id, key, title FROM citation_nodes WHERE id IN ({','.join(['?'] * len(chunk))})", chunk
+                ))
+        return titles
+
+    def most_cited_by(self, keys, limit=10):
+        """
+        The papers cited by the most members of keys: the column sums of A
+        restricted to those rows. Returns [{"key", "title", "count"}], most cited first.
+        """
+        rows, _ = self._indicator(keys)
+        if not len(rows):
+            return []
+        counts = np.asarray(self._adjacency()[rows].sum(axis=0)).ravel()
+        nonzero = np.flatnonzero(counts)
+        if not len(nonzero):
+            return []
+        limit = min(limit, len(nonzero))
+        top = nonzero[np.argpartition(-counts[nonzero], limit - 1)[:limit]]
+        # Ties are broken by node id so the ranking is stable
+        top = top[np.lexsort((top, -counts[top]))]
+        titles = self._titles(top)
+        return [{"key": titles[i][0], "title": titles[i][1], "count": int(counts[i])} for i in top]
+
+    def co_citation(self, keys):
+        """
+        Co-citation counts: entry (i, j) is the number of papers citing both
+        keys[i] and keys[j], i.e. (A^T A) on those columns. Returns the keys
+        found in the graph and the dense count matrix over them.
+        """
+        cols, present = self._indicator(keys)
+        sub = self._adjacency()[:, cols]
+        return present, (sub.T @ sub).toarray().astype(np.int64)
+
+    def bibliographic_coupling(self, keys):
+        """
+        Bibliographic coupling: entry (i, j) is the number of references
+        keys[i] and keys[j] share, i.e. (A A^T) on those rows.
+        """
+        rows, present = self._indicator(keys)
+        sub = self._adjacency()[rows]
+        return present, (sub @ sub.T).toarray().astype(np.int64)
+
+    def close(self):
+        self.conn.close()
+
+if __name__ == "__main__":
+    import tempfile, os
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = CitationGraph(os.path.join(tmp, "citations.db"))
+        graph.add_references({
+            "arxiv:A": [("arxiv:X", "Paper X"), ("arxiv:Y", "Paper Y")],
+            "arxiv:B": [("arxiv:X", "Paper X"), ("s2:Z", "Paper Z")],
+            "arxiv:C": [("arxiv:X", "Paper X"), ("arxiv:Y", "Paper Y")],
+        }, source="demo")
+        print(graph.most_cited_by(["arxiv:A", "arxiv:B", "arxiv:C"], limit=2))
+        print(graph.co_citation(["arxiv:X", "arxiv:Y", "s2:Z"]))
+        print(graph.bibliographic_coupling(["arxiv:A", "arxiv:B", "arxiv:C"]))
+        graph.close()
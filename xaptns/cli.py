@@ -1,27 +1,47 @@
 import click
+import os
 import sys
-import requests
-import json
-from collections import Counter
-from xaptns.ingestion import fetch_arxiv_data, fetch_citations
-from xaptns.model import Embedder
-from xaptns.search import VectorIndex
-from xaptns.navigator import Navigator
-from xaptns.cartographer import Cartographer
-from xaptns.concepts import ConceptMapper
+from xaptns.search import VectorIndex, evaluate_quantization
 import numpy as np
 
+# Heavy dependencies (torch/transformers/OpenVINO via xaptns.model, scipy,
+# ripser, arxiv, requests) are imported inside the commands that use them,
+# so `xaptns --help` and the DB-only commands start fast.
+
+def _load_embedder(workers):
+    """
+    A plain Embedder, or an EmbedderPool of worker processes when workers > 1.
+    """
+    if workers > 1:
+        from xaptns.pool import EmbedderPool
+        return EmbedderPool(num_workers=workers)
+    from xaptns.model import Embedder
+    return Embedder()
+
 @click.group()
-def cli():
+@click.option('--offline', is_flag=True, help='Serve arXiv/Semantic Scholar/OpenAlex responses from the local cache only.')
+def cli(offline):
     """Xaptns: High-performance engine for navigating scientific literature."""
-    pass
+    if offline:
+        os.environ["XAPTNS_OFFLINE"] = "1"
 
 @cli.command()
 @click.option('--id', required=True, help='arXiv ID of the seed paper.')
 @click.option('--limit', default=10, help='Number of similar papers to find.')
 @click.option('--rank-citations', 'rank_citations', default=3, help='Number of top common citations to list.')
-def search(id, limit, rank_citations):
+@click.option('--category', multiple=True, help='Only return papers in this arXiv category (repeatable).')
+@click.option('--year-min', 'year_min', type=int, default=None, help='Only return papers published in or after this year.')
+@click.option('--year-max', 'year_max', type=int, default=None, help='Only return papers published in or before this year.')
+@click.option('--author', default=None, help='Only return papers with an author matching this name.')
+@click.option('--workers', default=1, help='Embedding worker processes (1 embeds in this process).')
+def search(id, limit, rank_citations, category, year_min, year_max, author, workers):
     """Find similar papers and rank common citations."""
+    from concurrent.futures import ThreadPoolExecutor
+    from xaptns.citations import CitationGraph, paper_key
+    from xaptns.http_cache import default_cache
+    from xaptns.ingestion import (fetch_arxiv_data, fetch_arxiv_data_many, fetch_citations, fetch_reference_keys,
+                                  S2_MAX_WORKERS)
+    embedder = None
     try:
         # 1. Fetch seed paper
         click.echo(f"[*] Fetching seed paper {id}...")
@@ -35,8 +55,8 @@ def search(id, limit, rank_citations):
         # 2. Find candidate papers
         click.echo(f"[*] Discovering candidate papers related to {id}...")
         # Use Semantic Scholar Recommendations API
-        rec_url = f"https://api.semanticscholar.org/recommendations/v1/papers/forpaper/arXiv:{id}?limit=50&fields=title,externalIds,abstract"
-        resp = requests.get(rec_url, timeout=15)
+        rec_url = f"https://api.semanticscholar.org/recommendations/v1/papers/forpaper/arXiv:{id}?limit=50&fields=title,externalIds,abstract,year,authors"
+        resp = default_cache().get_json(rec_url, timeout=15)
 
         candidates = []
         if resp.status_code == 200:
@@ -58,7 +78,7 @@ def search(id, limit, rank_citations):
 
         # 3. Embed papers
         # Initialize embedder (will detect Intel/AMD hardware)
-        embedder = Embedder()
+        embedder = _load_embedder(workers)
 
         click.echo(f"[*] Embedding seed paper...")
         seed_text = f"{seed_paper['title']} {seed_paper['abstract']}"
@@ -67,6 +87,7 @@ def search(id, limit, rank_citations):
         vindex = VectorIndex(dim=768)
 
         click.echo(f"[*] Embedding {len(candidates)} candidates...")
+        cand_ids, cand_texts, cand_metas = [], [], []
         for cand in candidates:
             # Try to get ArXiv ID, fallback to paperId
             ext_ids = cand.get('externalIds', {})
@@ -80,14 +101,34 @@ def search(id, limit, rank_citations):
                 continue
 
             # Use title and abstract for embedding if available
-            cand_text = f"{title} {abstract}"
-            cand_vec = embedder.embed(cand_text)
-
-            vindex.add(cand_id, cand_vec, {"title": title, "paperId": cand.get('paperId')})
+            cand_ids.append(cand_id)
+            cand_texts.append(f"{title} {abstract}")
+            cand_metas.append({
+                "title": title,
+                "paperId": cand.get('paperId'),
+                "year": cand.get('year'),
+                "authors": [a.get('name') for a in cand.get('authors') or [] if a.get('name')]
+            })
+
+        # Recommendations carry no arXiv categories; take them from arXiv (one batched,
+        # cached lookup) so --category also matches the fresh candidates
+        arxiv_cands = [aid for aid, meta in zip(cand_ids, cand_metas) if aid != meta["paperId"]]
+        if arxiv_cands:
+            arxiv_papers = fetch_arxiv_data_many(arxiv_cands)
+            for aid, meta in zip(cand_ids, cand_metas):
+                if aid in arxiv_papers:
+                    meta["categories"] = arxiv_papers[aid]["categories"]
+                    meta["year"] = meta["year"] or arxiv_papers[aid]["year"]
+
+        if cand_ids:
+            # One call, so the embedder can batch (and a pool can spread) the candidates
+            vindex.add_many(cand_ids, embedder.embed(cand_texts), cand_metas)
 
         # 4. Search
         click.echo(f"[*] Finding top {limit} similar papers in semantic space...")
-        results = vindex.search(seed_vec, limit=limit)
+        where = {"categories": list(category), "year_min": year_min, "year_max": year_max, "authors": author}
+        results = vindex.search(seed_vec, limit=limit, fields=["title", "paperId"], where=where)
+        vindex.close()
 
         click.echo("\n" + "="*60)
         click.echo(f"{'Top Similar Papers':^60}")
@@ -102,33 +143,33 @@ def search(id, limit, rank_citations):
             click.echo(f"{'Ranking Top ' + str(rank_citations) + ' Common Citations':^60}")
             click.echo("="*60)
 
-            all_refs = []
-            # To avoid excessive API calls in MVP, we only check the top 'limit' papers
+            graph = CitationGraph()
+            # Results without an arXiv ID were stored under their Semantic Scholar ID
+            s2_ids = {}
             for res in results:
                 p_id = res['metadata'].get('paperId')
-                if not p_id:
-                    continue
-
-                # Fetch references for this paper
-                ref_url = f"https://api.semanticscholar.org/graph/v1/paper/{p_id}/references?fields=title&limit=50"
-                try:
-                    r_resp = requests.get(ref_url, timeout=10)
-                    if r_resp.status_code == 200:
-                        json_data = r_resp.json()
-                        ref_data = json_data.get('data')
-                        if ref_data:
-                            for r in ref_data:
-                                cited = r.get('citedPaper')
-                                if cited and cited.get('title'):
-                                    all_refs.append(cited.get('title'))
-                except Exception as e:
-                    click.echo(f"Warning: Failed to fetch references for {p_id}: {e}", err=True)
-
-            if all_refs:
-                common = Counter(all_refs).most_common(rank_citations)
-                for i, (title, count) in enumerate(common, 1):
-                    click.echo(f"{i:2d}. {title}")
-                    click.echo(f"    (Cited by {count} of the similar papers)")
+                aid = res['arxiv_id'] if res['arxiv_id'] != p_id else None
+                s2_ids[paper_key(arxiv_id=aid, s2_id=p_id)] = p_id
+
+            # Rank from the local citation graph; only papers without stored references hit the network
+            stored = graph.has_references(s2_ids)
+            to_fetch = [(key, p_id) for key, p_id in s2_ids.items() if key not in stored and p_id]
+            if to_fetch:
+                click.echo(f"[*] Fetching references for {len(to_fetch)} papers not in the local citation graph...")
+                # Few workers: unauthenticated Semantic Scholar access is tightly rate limited
+                with ThreadPoolExecutor(max_workers=S2_MAX_WORKERS) as executor:
+                    fetched = list(executor.map(lambda kp: (kp[0], fetch_reference_keys(kp[1])), to_fetch))
+                fetched = [(key, result) for key, result in fetched if result is not None]
+                # References keyed by arXiv ID or DOI absorb any node stored under their S2 ID
+                graph.add_aliases({alias: canonical for _, (_, aliases) in fetched for alias, canonical in aliases.items()})
+                graph.add_references({key: refs for key, (refs, _) in fetched}, source="semanticscholar")
+
+            common = graph.most_cited_by(list(s2_ids), limit=rank_citations)
+            graph.close()
+            if common:
+                for i, cited in enumerate(common, 1):
+                    click.echo(f"{i:2d}. {cited['title'] or cited['key']}")
+                    click.echo(f"    (Cited by {cited['count']} of the similar papers)")
             else:
                 click.echo("No common citations found.")
 
@@ -138,60 +179,83 @@ def search(id, limit, rank_citations):
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        if hasattr(embedder, "close"):
+            embedder.close()
 
 @cli.command()
-@click.option('--ids', required=True, help='Comma-separated arXiv IDs.')
+@click.option('--ids', required=True, multiple=True, help='Comma-separated arXiv IDs; repeat for several centroids.')
+@click.option('--weights', multiple=True, help='Comma-separated weights matching each --ids, in the same order.')
 @click.option('--limit', default=10, help='Number of papers to find near the center.')
-def centroid(ids, limit):
+@click.option('--workers', default=1, help='Embedding worker processes (1 embeds in this process).')
+def centroid(ids, weights, limit, workers):
     """Find the thematic center of multiple papers."""
+    from xaptns.navigator import Navigator
+    embedder = None
     try:
-        id_list = [i.strip() for i in ids.split(',')]
-        embedder = Embedder()
+        id_sets = [[i.strip() for i in group.split(',') if i.strip()] for group in ids]
+        if weights and len(weights) != len(id_sets):
+            raise click.BadParameter("Pass one --weights per --ids.", param_hint="--weights")
+        weight_sets = [[float(w) for w in group.split(',')] for group in weights] or None
         vindex = VectorIndex()
         nav = Navigator(vindex)
 
-        vectors = []
-        for aid in id_list:
-            paper = fetch_arxiv_data(aid)
-            if paper:
-                text = f"{paper['title']} {paper['abstract']}"
-                vec = embedder.embed(text)
-                vectors.append(vec)
-
-        if not vectors:
-            click.echo("Error: No papers found to calculate centroid.", err=True)
-            return
-
-        c_vec = nav.calculate_centroid(vectors)
-        results = vindex.search(c_vec, limit=limit)
+        # Stored vectors come from one query; only papers not yet in the index are fetched and embedded
+        all_ids = list(dict.fromkeys(aid for group in id_sets for aid in group))
+        vectors = vindex.get_vectors(all_ids)
+        missing = [aid for aid in all_ids if aid not in vectors]
+        if missing:
+            from xaptns.ingestion import fetch_arxiv_data_many
+            papers = fetch_arxiv_data_many(missing)
+            found = [aid for aid in missing if aid in papers]
+            if found:
+                click.echo(f"[*] Embedding {len(found)} papers not yet in the index...")
+                embedder = _load_embedder(workers)
+                new_vectors = embedder.embed([f"{papers[aid]['title']} {papers[aid]['abstract']}" for aid in found])
+                metadatas = [{"title": papers[aid]['title'], "abstract": papers[aid]['abstract'],
+                              "authors": papers[aid]['authors'], "categories": papers[aid]['categories'],
+                              "year": papers[aid]['year']} for aid in found]
+                vindex.add_many(found, new_vectors, metadatas)
+                vectors.update(zip(found, new_vectors))
+
+        answers = nav.search_centroids(id_sets, vectors, weight_sets, limit=limit, fields=["title"])
+        vindex.close()
+
+        for used, results in answers:
+            if not used:
+                click.echo("Error: No papers found to calculate centroid.", err=True)
+                continue
 
-        click.echo("\n" + "="*60)
-        click.echo(f"{'Papers Near Synthetic Centroid':^60}")
-        click.echo("="*60)
-        for i, res in enumerate(results, 1):
-            click.echo(f"{i:2d}. [{res['arxiv_id']:>12}] {res['metadata']['title'][:70]}")
-            click.echo(f"    (Distance: {res['distance']:.4f})")
+            click.echo("\n" + "="*60)
+            click.echo(f"{'Papers Near Synthetic Centroid':^60}")
+            click.echo("="*60)
+            if len(id_sets) > 1:
+                click.echo(f"Centroid of: {', '.join(used)}")
+            for i, res in enumerate(results, 1):
+                click.echo(f"{i:2d}. [{res['arxiv_id']:>12}] {res['metadata']['title'][:70]}")
+                click.echo(f"    (Distance: {res['distance']:.4f})")
 
     except Exception as e:
         click.echo(f"\nFATAL ERROR: {e}", err=True)
         sys.exit(1)
+    finally:
+        if hasattr(embedder, "close"):
+            embedder.close()
 
 @cli.command()
 @click.option('--ids', required=True, help='Comma-separated arXiv IDs to analyze for voids.')
 def voids(ids):
     """Detect research voids and map them to concepts."""
+    from xaptns.cartographer import Cartographer
+    from xaptns.concepts import ConceptMapper
     try:
         id_list = [i.strip() for i in ids.split(',')]
         vindex = VectorIndex()
         carto = Cartographer(vindex)
         mapper = ConceptMapper()
 
-        vectors = []
-        for aid in id_list:
-            vindex.cursor.execute("SELECT vector FROM papers WHERE arxiv_id = ?", (aid,))
-            row = vindex.cursor.fetchone()
-            if row:
-                vectors.append(np.frombuffer(row[0], dtype=np.float32))
+        stored = vindex.get_vectors(id_list)
+        vectors = [stored[aid] for aid in id_list if aid in stored]
 
         if len(vectors) < 5:
             click.echo("Error: Not enough papers in database to perform TDA. Run 'search' or 'centroid' first to ingest them.", err=True)
@@ -230,8 +294,16 @@ def voids(ids):
 @cli.command()
 @click.option('--cluster-a', 'cluster_a', required=True, help='Comma-separated arXiv IDs for Cluster A.')
 @click.option('--cluster-b', 'cluster_b', required=True, help='Comma-separated arXiv IDs for Cluster B.')
-def bridge(cluster_a, cluster_b):
+@click.option('--pivots', default=256, help='Sampled source papers for approximate betweenness (0 = exact).')
+@click.option('--seed', default=0, help='Random seed for pivot sampling.')
+@click.option('--between-clusters', 'between_clusters', is_flag=True, help='Only count paths from Cluster A to Cluster B.')
+@click.option('--workers', default=None, type=int, help='Processes for pivots (default: all cores on large graphs).')
+@click.option('--neighbors', default=10, help='Nearest neighbors added per paper from the index (0 = only the given papers).')
+@click.option('--hops', default=1, help='Rounds of neighbor expansion.')
+@click.option('--max-nodes', 'max_nodes', default=10000, help='Most papers in the expanded graph.')
+def bridge(cluster_a, cluster_b, pivots, seed, between_clusters, workers, neighbors, hops, max_nodes):
     """Identify bridge papers between two clusters."""
+    from xaptns.navigator import Navigator
     try:
         a_ids = [i.strip() for i in cluster_a.split(',')]
         b_ids = [i.strip() for i in cluster_b.split(',')]
@@ -239,21 +311,136 @@ def bridge(cluster_a, cluster_b):
         vindex = VectorIndex()
         nav = Navigator(vindex)
 
-        bridges = nav.find_bridge_papers(a_ids, b_ids)
+        bridges = nav.find_bridge_papers(a_ids, b_ids, k=pivots or None, seed=seed,
+                                         between_clusters=between_clusters, workers=workers,
+                                         neighbors=neighbors, hops=hops, max_nodes=max_nodes)
+        titles = vindex.get_metadata([b['arxiv_id'] for b in bridges], fields=["title"])
 
         click.echo("\n" + "="*60)
         click.echo(f"{'Identified Bridge Papers':^60}")
         click.echo("="*60)
         for i, b in enumerate(bridges, 1):
-            # Fetch title if possible
-            title = "Unknown Title"
-            vindex.cursor.execute("SELECT metadata FROM papers WHERE arxiv_id = ?", (b['arxiv_id'],))
-            row = vindex.cursor.fetchone()
-            if row:
-                title = json.loads(row[0]).get('title', 'Unknown Title')
+            title = titles.get(b['arxiv_id'], {}).get('title', 'Unknown Title')
 
             click.echo(f"{i:2d}. [{b['arxiv_id']:>12}] {title[:70]}")
-            click.echo(f"    (Betweenness Score: {b['centrality_score']:.4f})")
+            click.echo(f"    (Betweenness Score: {b['centrality_score']:.4f} +/- {b['centrality_error']:.4f})")
+
+    except Exception as e:
+        click.echo(f"\nFATAL ERROR: {e}", err=True)
+        sys.exit(1)
+
+@cli.command()
+@click.option('--file', 'file_path', required=True, help='Path to the arXiv Kaggle metadata JSONL file.')
+@click.option('--limit', type=int, default=None, help='Maximum number of records to read in this run.')
+@click.option('--batch-size', 'batch_size', default=256, help='Records embedded and written per batch.')
+@click.option('--workers', default=1, help='Embedding worker processes (1 embeds in this process).')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint and read the file from the start.')
+def ingest(file_path, limit, batch_size, workers, restart):
+    """Stream the arXiv Kaggle dump into the index, resuming from the last checkpoint."""
+    from xaptns.cargo import CargoCrane
+    embedder = None
+    try:
+        embedder = _load_embedder(workers)
+        vindex = VectorIndex(commit_interval=batch_size)
+        stats = CargoCrane().ingest(file_path, vindex, embedder, batch_size=batch_size, limit=limit, resume=not restart)
+        vindex.close()
+        if not stats:
+            sys.exit(1)
+
+        click.echo("\n" + "="*60)
+        click.echo(f"{'Ingested ' + str(stats['written']) + ' Papers':^60}")
+        click.echo("="*60)
+        click.echo(f"Read {stats['read']}, already stored {stats['skipped']}, malformed {stats['malformed']}")
+        click.echo(f"{'Stage':<10}{'Seconds':>12}{'Records/s':>14}")
+        for stage, seconds in stats['seconds'].items():
+            click.echo(f"{stage:<10}{seconds:>12.2f}{stats['records_per_s'][stage]:>14.1f}")
+        if stats['failed']:
+            sys.exit(1)
+
+    except Exception as e:
+        click.echo(f"\nFATAL ERROR: {e}", err=True)
+        sys.exit(1)
+    finally:
+        if hasattr(embedder, "close"):
+            embedder.close()
+
+@cli.command(name='cache-stats')
+def cache_stats():
+    """Show the HTTP response cache's hit rate and the network time it saved."""
+    from xaptns.http_cache import default_cache
+    try:
+        stats = default_cache().stats()
+        click.echo("\n" + "="*60)
+        click.echo(f"{'HTTP Response Cache':^60}")
+        click.echo("="*60)
+        click.echo(f"Hits: {stats['hits']} ({stats['stale_hits']} stale), misses: {stats['misses']}, "
+                   f"hit rate: {stats['hit_rate']:.1%}")
+        click.echo(f"Network time saved: {stats['saved_seconds']:.1f}s, background refreshes: {stats['revalidations']}")
+        for source, count in sorted(stats['entries'].items()):
+            click.echo(f"  {source:<20}{count:>8} entries")
+
+    except Exception as e:
+        click.echo(f"\nFATAL ERROR: {e}", err=True)
+        sys.exit(1)
+
+@cli.command(name='eval-quantization')
+@click.option('--k', default=10, help='Number of neighbors per query (recall@k).')
+@click.option('--oversample', default='1,5,10,20', help='Comma-separated b1 oversampling factors to evaluate.')
+@click.option('--queries', default=100, help='Number of stored papers to use as queries.')
+@click.option('--seed', default=0, help='Random seed for query sampling.')
+def eval_quantization(k, oversample, queries, seed):
+    """Report recall@k of binary-quantized search against the i8 index."""
+    try:
+        factors = [int(o.strip()) for o in oversample.split(',')]
+        report = evaluate_quantization(k=k, oversamples=factors, num_queries=queries, seed=seed)
+        if not report:
+            click.echo("Error: No papers in database to evaluate. Run 'search' first to ingest some.", err=True)
+            return
+
+        click.echo("\n" + "="*60)
+        click.echo(f"{'Quantization Recall@' + str(k):^60}")
+        click.echo("="*60)
+        click.echo(f"{'Index':<6}{'Oversample':>11}{'Recall':>10}{'vs i8':>10}{'ms/query':>11}{'MB':>10}")
+        for row in report:
+            over = f"{row['oversample']}x" if row['oversample'] else "-"
+            click.echo(f"{row['index']:<6}{over:>11}{row['recall_exact']:>10.3f}{row['recall_i8']:>10.3f}"
+                       f"{row['ms_per_query']:>11.3f}{row['memory_bytes'] / 1e6:>10.1f}")
+
+    except Exception as e:
+        click.echo(f"\nFATAL ERROR: {e}", err=True)
+        sys.exit(1)
+
+@cli.command()
+@click.option('--synthetic', type=int, default=None, help='Benchmark on N synthetic vectors instead of the stored corpus.')
+@click.option('--dim', default=768, help='Dimension of synthetic vectors.')
+@click.option('--k', default=10, help='Number of neighbors per query (recall@k).')
+@click.option('--queries', default=200, help='Number of queries to time.')
+@click.option('--connectivity', default='16,32', help='Comma-separated HNSW connectivity values.')
+@click.option('--expansion', default='32,64,128', help='Comma-separated HNSW expansion_search values.')
+def benchmark(synthetic, dim, k, queries, connectivity, expansion):
+    """Compare exact and HNSW search: build time, latency, QPS and recall."""
+    from xaptns.benchmark import benchmark_backends, synthetic_corpus, load_corpus
+    try:
+        vectors = synthetic_corpus(synthetic, dim=dim) if synthetic else load_corpus()
+        if len(vectors) == 0:
+            click.echo("Error: No papers in database to benchmark. Use --synthetic N or ingest papers first.", err=True)
+            return
+
+        report = benchmark_backends(
+            vectors, k=k, num_queries=queries,
+            connectivities=[int(c) for c in connectivity.split(',')],
+            expansions=[int(e) for e in expansion.split(',')]
+        )
+
+        click.echo("\n" + "="*72)
+        click.echo(f"{'Search Backends on ' + str(len(vectors)) + ' Vectors':^72}")
+        click.echo("="*72)
+        click.echo(f"{'Backend':<8}{'M':>5}{'ef':>6}{'Build s':>10}{'p50 ms':>10}{'p99 ms':>10}{'QPS':>12}{'Recall':>9}")
+        for row in report:
+            m = row['connectivity'] or "-"
+            ef = row['expansion_search'] or "-"
+            click.echo(f"{row['backend']:<8}{m:>5}{ef:>6}{row['build_s']:>10.2f}{row['p50_ms']:>10.3f}"
+                       f"{row['p99_ms']:>10.3f}{row['qps']:>12.0f}{row['recall']:>9.3f}")
 
     except Exception as e:
         click.echo(f"\nFATAL ERROR: {e}", err=True)
@@ -0,0 +1,148 @@
+import atexit
+import hashlib
+import sqlite3
+import sys
+import threading
+import time
+import numpy as np
+
+# Keys looked up per SQLite query
+LOOKUP_CHUNK = 500
+# Seconds between writes of the last-used times of cache hits; they are kept in memory in between
+TOUCH_FLUSH_INTERVAL = 30
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed store of embeddings. Entries are keyed by a
+    hash of everything that determines the vector (model name, model revision,
+    max_length and the exact input text), so a changed model or text never
+    returns a stale vector. Once more than max_entries are stored, the least
+    recently used ones are evicted. Hits only update an in-memory last-used
+    time, written back in batches, so reads never wait on the write lock.
+    """
+    def __init__(self, path, max_entries=1_000_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> wall-clock time of its latest hit, not yet written to last_used
+        self._touched = {}
+        self._last_flush = time.monotonic()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB,
+                last_used INTEGER
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self.conn.commit()
+        # Upper bound on the entry count; recounted only when it crosses max_entries
+        self._entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        atexit.register(self.flush)
+
+    @staticmethod
+    def key(model_name, revision, text, max_length):
+        payload = "\0".join([model_name, str(revision), str(max_length), text])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """
+        Returns {key: vector} for the cached keys and counts hits and misses.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[start:start + LOOKUP_CHUNK]
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join(['?'] * len(chunk))})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            now = time.time()
+            self._touched.update((k, now) for k in found)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+            if time.monotonic() - self._last_flush >= TOUCH_FLUSH_INTERVAL:
+                self._flush_touched()
+        return found
+
+    def _flush_touched(self):
+        # Called with self._lock held
+        self._last_flush = time.monotonic()
+        if not self._touched:
+            return
+        try:
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?", [(t, k) for k, t in self._touched.items()]
+            )
+            self.conn.commit()
+            self._touched = {}
+        except sqlite3.OperationalError as e:
+            # Another process holds the database; keep the times for the next flush
+            self.conn.rollback()
+            print(f"Warning: Could not save embedding cache access times: {e}", file=sys.stderr)
+
+    def flush(self):
+        """
+        Writes pending last-used times to the database; runs at exit.
+        """
+        with self._lock:
+            try:
+                self._flush_touched()
+            except sqlite3.ProgrammingError:
+                # Connection already closed
+                pass
+
+    def put_many(self, items):
+        """
+        Stores (key, vector) pairs and evicts the least recently used entries
+        if the cache grew past max_entries.
+        """
+        items = list(items)
+        if not items:
+            return
+        with self._lock:
+            if self._entries + len(items) > self.max_entries:
+                # Eviction must see the recent hits, or it would drop entries still in use
+                self._flush_touched()
+            now = time.time()
+            try:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                    [(k, np.asarray(v, dtype=np.float32).tobytes(), now) for k, v in items]
+                )
+                self._entries += len(items)
+                if self._entries > self.max_entries:
+                    self._entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                    if self._entries > self.max_entries:
+                        self.conn.execute(
+                            "DELETE FROM embeddings WHERE key IN "
+                            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                            (self._entries - self.max_entries,)
+                        )
+                        self._entries = self.max_entries
+                self.conn.commit()
+            except sqlite3.OperationalError as e:
+                # The vectors are still returned by embed(); they just are not cached this time
+                self.conn.rollback()
+                print(f"Warning: Could not cache {len(items)} embeddings: {e}", file=sys.stderr)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0],
+            "max_entries": self.max_entries,
+        }
+
+    def close(self):
+        self.flush()
+        atexit.unregister(self.flush)
+        self.conn.close()
@@ -0,0 +1,103 @@
+import numpy as np
+
+class ExactMatches:
+    """
+    Batch search results shaped like usearch's BatchMatches.
+    """
+    def __init__(self, keys, distances, counts):
+        self.keys = keys
+        self.distances = distances
+        self.counts = counts
+
+class ExactIndex:
+    """
+    Exact cosine top-k over a contiguous matrix of L2-normalized float32
+    vectors: one matrix multiply plus argpartition per query batch.
+    Implements the subset of the usearch Index API that VectorIndex uses,
+    so it can stand in for HNSW on small corpora where the graph is overhead.
+    """
+    def __init__(self, ndim):
+        self.ndim = ndim
+        self._matrix = np.zeros((0, ndim), dtype=np.float32)
+        self._keys = np.zeros(0, dtype=np.uint64)
+        self._size = 0
+        self._positions = {}
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def vectors(self):
+        return self._matrix[:self._size]
+
+    @property
+    def keys(self):
+        return self._keys[:self._size]
+
+    @property
+    def memory_usage(self):
+        return self._matrix.nbytes + self._keys.nbytes
+
+    def _reserve(self, capacity):
+        if capacity <= len(self._matrix):
+            return
+        # Grow geometrically so streaming adds stay amortized O(1)
+        capacity = max(capacity, 2 * len(self._matrix), 1024)
+        matrix = np.zeros((capacity, self.ndim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        keys = np.zeros(capacity, dtype=np.uint64)
+        keys[:self._size] = self._keys[:self._size]
+        self._matrix, self._keys = matrix, keys
+
+    def contains(self, keys):
+        keys = np.atleast_1d(np.asarray(keys, dtype=np.uint64))
+        return np.array([int(k) in self._positions for k in keys], dtype=bool)
+
+    def add(self, keys, vectors, threads=0):
+        keys = np.atleast_1d(np.asarray(keys, dtype=np.uint64))
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(keys), self.ndim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+
+        self._reserve(self._size + len(keys))
+        for key, vec in zip(keys, vectors):
+            pos = self._positions.get(int(key))
+            if pos is None:
+                pos = self._size
+                self._positions[int(key)] = pos
+                self._keys[pos] = key
+                self._size += 1
+            self._matrix[pos] = vec
+
+    def remove(self, keys):
+        for key in np.atleast_1d(np.asarray(keys, dtype=np.uint64)):
+            pos = self._positions.pop(int(key), None)
+            if pos is None:
+                continue
+            # Swap the last row into the hole to keep the matrix contiguous
+            last = self._size - 1
+            if pos != last:
+                self._matrix[pos] = self._matrix[last]
+                self._keys[pos] = self._keys[last]
+                self._positions[int(self._keys[pos])] = pos
+            self._size -= 1
+
+    def search(self, queries, count=10, threads=0):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.ndim)
+        n = len(queries)
+        k = min(count, self._size)
+        keys = np.zeros((n, count), dtype=np.uint64)
+        distances = np.full((n, count), np.nan, dtype=np.float32)
+        counts = np.full(n, k, dtype=np.int64)
+        if k == 0:
+            return ExactMatches(keys, distances, counts)
+
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = queries @ self.vectors.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        keys[:, :k] = self.keys[top]
+        distances[:, :k] = 1.0 - np.take_along_axis(top_scores, order, axis=1)
+        return ExactMatches(keys, distances, counts)
@@ -0,0 +1,314 @@
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# requests is imported where a fetch actually happens, so importing this module stays cheap.
+
+# Seconds an entry is fresh, per source. arXiv metadata almost never changes;
+# citation data moves faster.
+DEFAULT_TTLS = {
+    "arxiv": 30 * 86400,
+    "semanticscholar": 7 * 86400,
+    "openalex": 7 * 86400,
+}
+DEFAULT_TTL = 86400
+# After going stale, an entry is still served for this long while a background refresh runs
+STALE_WHILE_REVALIDATE = 7 * 86400
+# Statuses worth remembering: found, and definitively not found
+CACHEABLE_STATUSES = (200, 404)
+# Query parameters that never change the response
+IGNORED_PARAMS = {"mailto"}
+# Seconds between writes of the hit/miss counters; they are kept in memory in between
+COUNTER_FLUSH_INTERVAL = 30
+
+class CachedResponse:
+    """
+    The part of requests.Response the callers use: status_code and json().
+    """
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self._data = data
+
+    def json(self):
+        return self._data
+
+class HTTPCache:
+    """
+    On-disk cache of API responses shared by ingestion, CargoCrane and the CLI.
+    Entries are keyed by normalized URL (or a caller-chosen key such as
+    "arxiv:<id>"), expire after a per-source TTL, and are then served stale
+    for STALE_WHILE_REVALIDATE seconds while a background thread refreshes
+    them. In offline mode only the cache is consulted, however old the entry.
+    Hit/miss counts and the fetch time saved by hits persist across runs.
+    """
+    def __init__(self, path=None, ttls=None, stale_ttl=STALE_WHILE_REVALIDATE, offline=None):
+        if path is None:
+            cache_dir = os.path.join(os.getcwd(), ".model_cache")
+            os.makedirs(cache_dir, exist_ok=True)
+            path = os.path.join(cache_dir, "http_cache.db")
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.stale_ttl = stale_ttl
+        self.offline = os.environ.get("XAPTNS_OFFLINE") == "1" if offline is None else offline
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        # Counter deltas not yet written, so a cache hit never opens a write transaction
+        self._pending_counts = {}
+        self._last_flush = time.monotonic()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                source TEXT,
+                status INTEGER,
+                body TEXT,
+                fetched_at REAL,
+                latency REAL
+            )
+        ''')
+        self.conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value REAL)")
+        self.conn.commit()
+        atexit.register(self.flush_counters)
+
+    @staticmethod
+    def normalize_url(url, params=None):
+        """
+        Lowercases scheme and host, merges params into the query, sorts it
+        and drops IGNORED_PARAMS, so equivalent requests share one entry.
+        """
+        parts = urlsplit(url)
+        query = parse_qsl(parts.query, keep_blank_values=True) + list((params or {}).items())
+        query = sorted((k, str(v)) for k, v in query if k not in IGNORED_PARAMS)
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(query), ""))
+
+    def _count(self, **deltas):
+        # Called with self._lock held
+        for name, value in deltas.items():
+            self._pending_counts[name] = self._pending_counts.get(name, 0) + value
+        if time.monotonic() - self._last_flush >= COUNTER_FLUSH_INTERVAL:
+            self._flush_counts()
+
+    def _flush_counts(self):
+        self._last_flush = time.monotonic()
+        if not self._pending_counts:
+            return
+        try:
+            self.conn.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                list(self._pending_counts.items())
+            )
+            self.conn.commit()
+            self._pending_counts = {}
+        except sqlite3.Error as e:
+            # Another process holds the database; keep the counts for the next flush
+            self.conn.rollback()
+            print(f"Warning: Could not save HTTP cache counters: {e}", file=sys.stderr)
+
+    def flush_counters(self):
+        """
+        Writes the in-memory hit/miss counters to the database; runs at exit.
+        """
+        with self._lock:
+            try:
+                self._flush_counts()
+            except sqlite3.ProgrammingError:
+                # Connection already closed
+                pass
+
+    def _store(self, key, source, status, data, latency):
+        with self._lock:
+            try:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, source, status, body, fetched_at, latency) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, source, status, json.dumps(data), time.time(), latency)
+                )
+                self.conn.commit()
+            except sqlite3.OperationalError as e:
+                # The response is still returned; it just is not cached this time
+                self.conn.rollback()
+                print(f"Warning: Could not cache {key}: {e}", file=sys.stderr)
+
+    def _load(self, key, source, loader):
+        started = time.perf_counter()
+        status, data = loader()
+        latency = time.perf_counter() - started
+        if status in CACHEABLE_STATUSES:
+            self._store(key, source, status, data, latency)
+        return status, data
+
+    def _refresh(self, key, source, loader):
+        try:
+            self._load(key, source, loader)
+            with self._lock:
+                self._count(revalidations=1)
+        except Exception as e:
+            print(f"Warning: Background refresh of {key} failed: {e}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def fetch(self, key, source, loader):
+        """
+        Returns (status, data) for key. loader() performs the real request
+        and returns (status, json-serializable data); it only runs on a miss,
+        or in the background once a cached entry has gone stale.
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT status, body, fetched_at, latency FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                status, body, fetched_at, latency = row
+                age = time.time() - fetched_at
+                ttl = self.ttls.get(source, DEFAULT_TTL)
+                if age <= ttl or self.offline:
+                    self._count(hits=1, saved_seconds=latency)
+                    return status, json.loads(body)
+                if age <= ttl + self.stale_ttl:
+                    self._count(hits=1, stale_hits=1, saved_seconds=latency)
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        threading.Thread(target=self._refresh, args=(key, source, loader), daemon=True).start()
+                    return status, json.loads(body)
+            if self.offline:
+                self._count(offline_misses=1)
+            else:
+                self._count(misses=1)
+
+        if self.offline:
+            import requests
+            raise requests.ConnectionError(f"Offline mode: {key} is not cached")
+        return self._load(key, source, loader)
+
+    def fetch_many(self, keys, source, loader_many):
+        """
+        Batch form of fetch() for APIs that answer many keys in one request.
+        loader_many(keys) returns {key: (status, data)}; it is called once
+        for all misses, and stale entries are refreshed together in the
+        background. Returns {key: (status, data)} for every key it could serve.
+        """
+        keys = list(dict.fromkeys(keys))
+        found, stale, missing = {}, [], []
+        ttl = self.ttls.get(source, DEFAULT_TTL)
+        now = time.time()
+        with self._lock:
+            rows = {}
+            for start in range(0, len(keys), 900):
+                chunk = keys[start:start + 900]
+                rows.update((row[0], row[1:]) for row in self.conn.execute(
+                    f"SELECT key, status, body, fetched_at, latency FROM responses WHERE key IN ({','.join(['?'] * len(chunk))})",
+                    chunk
+                ))
+            saved = 0.0
+            for key in keys:
+                if key not in rows:
+                    missing.append(key)
+                    continue
+                status, body, fetched_at, latency = rows[key]
+                age = now - fetched_at
+                if age > ttl + self.stale_ttl and not self.offline:
+                    missing.append(key)
+                    continue
+                found[key] = (status, json.loads(body))
+                saved += latency
+                if age > ttl and not self.offline and key not in self._refreshing:
+                    self._refreshing.add(key)
+                    stale.append(key)
+            self._count(hits=len(found), stale_hits=len(stale), saved_seconds=saved,
+                        **({"offline_misses": len(missing)} if self.offline else {"misses": len(missing)}))
+
+        if stale:
+            threading.Thread(target=self._refresh_many, args=(stale, source, loader_many), daemon=True).start()
+        if missing and not self.offline:
+            found.update(self._load_many(missing, source, loader_many))
+        return found
+
+    def _load_many(self, keys, source, loader_many):
+        started = time.perf_counter()
+        loaded = loader_many(keys)
+        # One request served them all; spread its latency over the keys
+        latency = (time.perf_counter() - started) / max(len(keys), 1)
+        for key, (status, data) in loaded.items():
+            if status in CACHEABLE_STATUSES:
+                self._store(key, source, status, data, latency)
+        return loaded
+
+    def _refresh_many(self, keys, source, loader_many):
+        try:
+            self._load_many(keys, source, loader_many)
+            with self._lock:
+                self._count(revalidations=len(keys))
+        except Exception as e:
+            print(f"Warning: Background refresh of {len(keys)} entries failed: {e}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(keys)
+
+    def get_json(self, url, params=None, source=None, session=None, timeout=10):
+        """
+        Cached GET returning a CachedResponse. Only 200 and 404 responses are
+        stored; rate limits and server errors always go back to the network.
+        """
+        key = self.normalize_url(url, params)
+        if source is None:
+            host = urlsplit(url).netloc.lower()
+            source = next((s for s in self.ttls if s in host.replace(".", "")), host)
+
+        def loader():
+            import requests
+            response = (session or requests).get(url, params=params, timeout=timeout)
+            data = response.json() if response.status_code == 200 else None
+            return response.status_code, data
+
+        return CachedResponse(*self.fetch(key, source, loader))
+
+    def stats(self):
+        """
+        Lifetime hit rate and network time saved, plus the entry count per source.
+        """
+        with self._lock:
+            counters = dict(self.conn.execute("SELECT name, value FROM counters").fetchall())
+            for name, value in self._pending_counts.items():
+                counters[name] = counters.get(name, 0) + value
+            sources = dict(self.conn.execute("SELECT source, COUNT(*) FROM responses GROUP BY source").fetchall())
+        hits, misses = int(counters.get("hits", 0)), int(counters.get("misses", 0))
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "stale_hits": int(counters.get("stale_hits", 0)),
+            "revalidations": int(counters.get("revalidations", 0)),
+            "offline_misses": int(counters.get("offline_misses", 0)),
+            "saved_seconds": counters.get("saved_seconds", 0.0),
+            "entries": sources,
+            "offline": self.offline,
+        }
+
+    def close(self):
+        self.flush_counters()
+        atexit.unregister(self.flush_counters)
+        self.conn.close()
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+def default_cache():
+    """
+    The process-wide cache in .model_cache/http_cache.db, opened on first use.
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = HTTPCache()
+        return _default_cache
+
+if __name__ == "__main__":
+    cache = default_cache()
+    print(json.dumps(cache.stats(), indent=2))
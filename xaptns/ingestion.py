@@ -1,31 +1,127 @@
-import arxiv
-import requests
+import random
+import re
 import sys
+import threading
+import time
+from xaptns.http_cache import default_cache
+from xaptns.citations import paper_key
 
-def fetch_arxiv_data(arxiv_id):
+# arxiv is imported on first fetch; see _client().
+
+# IDs per arXiv API id_list query
+ARXIV_BATCH_SIZE = 100
+# Seconds between arXiv API requests, as the API terms ask
+ARXIV_DELAY_SECONDS = 3.0
+# A trailing version ("v2"); old-style IDs like solv-int/9901001 contain a "v" elsewhere
+ARXIV_VERSION_RE = re.compile(r"v\d+$")
+ARXIV_PREFIX_RE = re.compile(r"^(?:arxiv:|https?://arxiv\.org/(?:abs|pdf)/)", re.IGNORECASE)
+# Semantic Scholar: concurrent unauthenticated requests, and retries of 429/5xx responses
+S2_MAX_WORKERS = 2
+S2_MAX_RETRIES = 4
+S2_BACKOFF_SECONDS = 2.0
+
+_client_instance = None
+_client_lock = threading.Lock()
+
+def normalize_arxiv_id(arxiv_id):
     """
-    Fetches paper metadata from arXiv using its ID.
+    Canonical arXiv ID: no "arXiv:" or URL prefix and no version suffix.
+    """
+    return ARXIV_VERSION_RE.sub("", ARXIV_PREFIX_RE.sub("", arxiv_id.strip()))
+
+def _client():
+    """
+    One shared arxiv.Client, so its request delay applies across calls.
     """
+    global _client_instance
+    with _client_lock:
+        if _client_instance is None:
+            import arxiv
+            _client_instance = arxiv.Client(page_size=ARXIV_BATCH_SIZE, delay_seconds=ARXIV_DELAY_SECONDS)
+        return _client_instance
+
+def _paper_dict(paper):
+    return {
+        "id": paper.get_short_id(),
+        "title": paper.title,
+        "abstract": paper.summary,
+        "authors": [author.name for author in paper.authors],
+        "categories": paper.categories,
+        "year": paper.published.year if paper.published else None,
+        "url": paper.entry_id
+    }
+
+def _query_arxiv_many(keys):
+    """
+    Looks up "arxiv:<id>" cache keys in id_list queries of up to
+    ARXIV_BATCH_SIZE IDs. IDs arXiv does not return come back as 404.
+    IDs caught in a rate limit or server error are left out of the result,
+    so nothing is cached for them and they are asked again next time.
+    """
+    import arxiv
+    client = _client()
+    ids = [key[len("arxiv:"):] for key in keys]
+    found = {}
+    unanswered = set()
+    for start in range(0, len(ids), ARXIV_BATCH_SIZE):
+        chunk = ids[start:start + ARXIV_BATCH_SIZE]
+        try:
+            papers = list(client.results(arxiv.Search(id_list=chunk, max_results=len(chunk))))
+        except arxiv.HTTPError as e:
+            if e.status != 400:
+                print(f"Warning: arXiv returned HTTP {e.status} for {len(chunk)} IDs; not caching them", file=sys.stderr)
+                unanswered.update(chunk)
+                continue
+            if len(chunk) == 1:
+                # arXiv rejects malformed IDs outright (400); treat as not found
+                continue
+            # One malformed ID fails the whole query; retry the chunk ID by ID
+            papers = []
+            for i, aid in enumerate(chunk):
+                try:
+                    papers.extend(client.results(arxiv.Search(id_list=[aid], max_results=1)))
+                except arxiv.HTTPError as e:
+                    if e.status != 400:
+                        print(f"Warning: arXiv returned HTTP {e.status}; not caching {len(chunk) - i} IDs", file=sys.stderr)
+                        unanswered.update(chunk[i:])
+                        break
+        for paper in papers:
+            found[normalize_arxiv_id(paper.get_short_id())] = _paper_dict(paper)
+    return {f"arxiv:{aid}": (200, found[aid]) if aid in found else (404, None)
+            for aid in ids if aid in found or aid not in unanswered}
+
+def fetch_arxiv_data_many(arxiv_ids):
+    """
+    Fetches metadata for many papers with one client and as few arXiv
+    queries as possible; cached papers are not requested again.
+    Returns {arxiv_id: paper} keyed by the IDs as given, for papers found.
+    """
+    arxiv_ids = list(arxiv_ids)
+    clean = {aid: normalize_arxiv_id(aid) for aid in arxiv_ids}
     try:
-        # Normalize ID (remove version if present)
-        clean_id = arxiv_id.split('v')[0]
-        client = arxiv.Client()
-        search = arxiv.Search(id_list=[clean_id])
-        results = list(client.results(search))
-        if not results:
-            print(f"Error: No paper found with ID {arxiv_id}", file=sys.stderr)
-            return None
-        paper = results[0]
-        return {
-            "id": paper.entry_id.split("/")[-1],
-            "title": paper.title,
-            "abstract": paper.summary,
-            "authors": [author.name for author in paper.authors],
-            "url": paper.entry_id
-        }
+        served = default_cache().fetch_many([f"arxiv:{c}" for c in clean.values()], "arxiv", _query_arxiv_many)
     except Exception as e:
         print(f"Error fetching from arXiv: {e}", file=sys.stderr)
-        return None
+        return {}
+
+    papers = {}
+    for aid, clean_id in clean.items():
+        key = f"arxiv:{clean_id}"
+        if key not in served:
+            print(f"Error: Could not fetch {aid} from arXiv", file=sys.stderr)
+            continue
+        status, paper = served[key]
+        if paper:
+            papers[aid] = paper
+        else:
+            print(f"Error: No paper found with ID {aid}", file=sys.stderr)
+    return papers
+
+def fetch_arxiv_data(arxiv_id):
+    """
+    Fetches paper metadata from arXiv using its ID.
+    """
+    return fetch_arxiv_data_many([arxiv_id]).get(arxiv_id)
 
 def fetch_citations(arxiv_id):
     """
@@ -34,7 +130,7 @@ def fetch_citations(arxiv_id):
     try:
         # Semantic Scholar uses 'arXiv:<id>' for arXiv papers
         url = f"https://api.semanticscholar.org/graph/v1/paper/arXiv:{arxiv_id}?fields=references.title,references.paperId,references.externalIds"
-        response = requests.get(url, timeout=10)
+        response = default_cache().get_json(url, source="semanticscholar", timeout=10)
         if response.status_code == 200:
             data = response.json()
             return data.get("references", [])
@@ -48,6 +144,40 @@ def fetch_citations(arxiv_id):
         print(f"Error fetching citations: {e}", file=sys.stderr)
         return []
 
+def fetch_reference_keys(s2_paper_id):
+    """
+    Fetches a paper's reference list from Semantic Scholar as
+    (citation graph key, title) pairs, plus {"s2:<id>": key} aliases for
+    references keyed by arXiv ID or DOI. Rate limits and server errors are
+    retried with backoff. Returns None if the list could not be fetched.
+    """
+    url = f"https://api.semanticscholar.org/graph/v1/paper/{s2_paper_id}/references?fields=title,paperId,externalIds&limit=1000"
+    try:
+        for attempt in range(S2_MAX_RETRIES + 1):
+            response = default_cache().get_json(url, source="semanticscholar", timeout=10)
+            if response.status_code != 429 and response.status_code < 500:
+                break
+            if attempt < S2_MAX_RETRIES:
+                time.sleep(min(60.0, S2_BACKOFF_SECONDS * 2 ** attempt) * (0.5 + random.random() / 2))
+        if response.status_code != 200:
+            print(f"Warning: Semantic Scholar API returned status {response.status_code} for references of {s2_paper_id}",
+                  file=sys.stderr)
+            return None
+        refs, aliases = [], {}
+        for r in response.json().get("data") or []:
+            cited = r.get("citedPaper") or {}
+            external = cited.get("externalIds") or {}
+            key = paper_key(arxiv_id=external.get("ArXiv"), doi=external.get("DOI"), s2_id=cited.get("paperId"))
+            if key:
+                refs.append((key, cited.get("title")))
+                s2_key = paper_key(s2_id=cited.get("paperId"))
+                if s2_key and s2_key != key:
+                    aliases[s2_key] = key
+        return refs, aliases
+    except Exception as e:
+        print(f"Warning: Failed to fetch references for {s2_paper_id}: {e}", file=sys.stderr)
+        return None
+
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1:
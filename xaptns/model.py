@@ -1,17 +1,99 @@
-import torch
-from transformers import AutoTokenizer, AutoModel
-import openvino as ov
 import numpy as np
 import os
+import queue
 import sys
-import onnxruntime as ort
+import threading
+import time
+from xaptns.embedding_cache import EmbeddingCache
+
+# torch, transformers, openvino and onnxruntime are imported where they are
+# used, so importing this module (or constructing an Embedder) stays cheap.
+
+# Padded tokens per inference batch, e.g. 32 full-length abstracts or ~500 titles
+DEFAULT_MAX_BATCH_TOKENS = 16384
+# Texts tokenized and length-sorted together; bounds memory for very long inputs
+SORT_WINDOW = 8192
+# Texts embed_stream reads, tokenizes and length-sorts at a time
+STREAM_WINDOW = 1024
+# Batches buffered between pipeline stages
+STREAM_DEPTH = 4
+# The INT8 CPU model is only used if every validation text keeps at least this cosine to fp32
+INT8_MIN_COSINE = 0.99
+# Held-out texts for checking the quantized model against the fp32 one
+VALIDATION_TEXTS = [
+    "Attention Is All You Need",
+    "SPECTER: Document-level Representation Learning using Citation-informed Transformers. "
+    "Representation learning is a critical ingredient for natural language processing systems.",
+    "Persistent homology of point clouds: computing topological features across scales with Vietoris-Rips filtrations.",
+    "Observation of a new boson at a mass of 125 GeV with the CMS experiment at the LHC",
+    "Protein structure prediction with deep learning achieves atomic accuracy on CASP14 targets.",
+    "Quantum annealing for combinatorial optimization problems on superconducting qubit hardware",
+    "Differential privacy guarantees for stochastic gradient descent in deep neural network training",
+    "On the cohomology of moduli spaces of stable curves",
+]
 
 class Embedder:
-    def __init__(self, model_name="allenai/specter2_base"):
+    def __init__(self, model_name="allenai/specter2_base", max_length=512, cache=True, cache_max_entries=1_000_000,
+                 max_batch_tokens=DEFAULT_MAX_BATCH_TOKENS, cpu_backend="onnx-int8", num_threads=None):
         self.model_name = model_name
+        # On plain CPUs: "onnx-int8" runs a dynamically quantized ONNX Runtime model,
+        # "torch" keeps eager fp32 PyTorch
+        self.cpu_backend = cpu_backend
+        self.num_threads = num_threads
+        self.max_length = max_length
+        # Upper bound on padded tokens (batch size * sequence length) per forward pass
+        self.max_batch_tokens = max(max_batch_tokens, max_length)
         self.cache_dir = os.path.join(os.getcwd(), ".model_cache")
         os.makedirs(self.cache_dir, exist_ok=True)
+        # Embeddings are cached per text, keyed by model, revision and max_length
+        self.cache = EmbeddingCache(os.path.join(self.cache_dir, "embeddings.db"),
+                                    max_entries=cache_max_entries) if cache else None
+
+        # The tokenizer and model are loaded on first use, see load()
+        self.tokenizer = None
+        self.model = None
+        self.device = None
+        self.ov_compiled_model = None
+        self.ort_session = None
+        self._revision = None
+        self._embedding_dim = None
+        self._loaded = False
+        # Busy/idle time of the inference stage in the last embed_stream run
+        self.stream_stats = {}
+
+    @property
+    def revision(self):
+        """
+        Hub commit of the model, so a model update invalidates cached embeddings.
+        Read from the config alone, so a fully cached batch never loads weights.
+        """
+        if self._revision is None:
+            from transformers import AutoConfig
+            config = AutoConfig.from_pretrained(self.model_name)
+            self._revision = getattr(config, "_commit_hash", None) or "unknown"
+        return self._revision
+
+    @property
+    def embedding_dim(self):
+        """
+        Width of the output vectors, from the config, so empty batches keep their shape.
+        """
+        if self._embedding_dim is None:
+            from transformers import AutoConfig
+            self._embedding_dim = AutoConfig.from_pretrained(self.model_name).hidden_size
+        return self._embedding_dim
+
+    def load(self):
+        """
+        Loads the tokenizer and model and picks the device. Called by the
+        first embed(); servers can call it up front to warm up.
+        """
+        if self._loaded:
+            return
+        import openvino as ov
+        from transformers import AutoTokenizer, AutoModel
 
+        model_name = self.model_name
         try:
             print(f"Loading model {model_name}...", file=sys.stderr)
             self.tokenizer = AutoTokenizer.from_pretrained(model_name)
@@ -19,19 +101,23 @@ class Embedder:
             self.core = ov.Core()
             self.device = self._detect_device()
             print(f"Detected device: {self.device}", file=sys.stderr)
-
-            self.ov_compiled_model = None
-            self.ort_session = None
+            if self.num_threads:
+                import torch
+                torch.set_num_threads(self.num_threads)
 
             if self.device in ["GPU", "MYRIAD", "NPU"]:
                 self._init_accel()
+            elif self.device == "cpu" and self.cpu_backend == "onnx-int8":
+                self._init_cpu_int8()
             else:
                 self.model.to(self.device)
+            self._loaded = True
         except Exception as e:
             print(f"Error initializing model: {e}", file=sys.stderr)
             raise
 
     def _detect_device(self):
+        import torch
         devices = self.core.available_devices
         print(f"Available OpenVINO devices: {devices}", file=sys.stderr)
 
@@ -54,23 +140,15 @@ class Embedder:
 
     def _init_accel(self):
         """Initializes OpenVINO or ONNX acceleration."""
+        import openvino as ov
+        import onnxruntime as ort
         onnx_path = os.path.join(self.cache_dir, "specter2.onnx")
         ov_path = os.path.join(self.cache_dir, "specter2.xml")
 
         try:
             # Try ONNX Runtime with OpenVINO EP first for NPU/GPU flexibility
             if "OpenVinoExecutionProvider" in ort.get_available_providers():
-                if not os.path.exists(onnx_path):
-                    print(f"Exporting model to ONNX...", file=sys.stderr)
-                    dummy_input = self.tokenizer("test", return_tensors="pt")
-                    torch.onnx.export(self.model,
-                                      (dummy_input["input_ids"], dummy_input["attention_mask"]),
-                                      onnx_path,
-                                      input_names=["input_ids", "attention_mask"],
-                                      output_names=["last_hidden_state"],
-                                      dynamic_axes={"input_ids": {0: "batch_size", 1: "sequence_length"},
-                                                   "attention_mask": {0: "batch_size", 1: "sequence_length"}},
-                                      opset_version=14)
+                self._export_onnx(onnx_path)
 
                 print(f"Initializing ONNX Runtime with OpenVinoExecutionProvider on {self.device}...", file=sys.stderr)
                 self.ort_session = ort.InferenceSession(onnx_path, providers=['OpenVinoExecutionProvider'],
@@ -99,39 +177,303 @@ class Embedder:
             self.device = "cpu"
             self.model.to("cpu")
 
+    def _export_onnx(self, onnx_path):
+        """Exports the fp32 model to ONNX once; later runs reuse the cached file."""
+        import torch
+        if os.path.exists(onnx_path):
+            return
+        print(f"Exporting model to ONNX...", file=sys.stderr)
+        dummy_input = self.tokenizer("test", return_tensors="pt")
+        torch.onnx.export(self.model,
+                          (dummy_input["input_ids"], dummy_input["attention_mask"]),
+                          onnx_path,
+                          input_names=["input_ids", "attention_mask"],
+                          output_names=["last_hidden_state"],
+                          dynamic_axes={"input_ids": {0: "batch_size", 1: "sequence_length"},
+                                       "attention_mask": {0: "batch_size", 1: "sequence_length"}},
+                          opset_version=14)
+
+    def _init_cpu_int8(self):
+        """
+        CPU path: ONNX export, dynamic INT8 weight quantization and full graph
+        optimization, run on the CPU execution provider. The quantized model is
+        only kept if it agrees with fp32 on VALIDATION_TEXTS.
+        """
+        import onnxruntime as ort
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        onnx_path = os.path.join(self.cache_dir, "specter2.onnx")
+        int8_path = os.path.join(self.cache_dir, "specter2.int8.onnx")
+
+        try:
+            self._export_onnx(onnx_path)
+            if not os.path.exists(int8_path):
+                print(f"Quantizing ONNX model to INT8...", file=sys.stderr)
+                quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            # One op at a time, each spread over every core: best for encoder-only models
+            options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+            options.intra_op_num_threads = self.num_threads or os.cpu_count() or 1
+            options.inter_op_num_threads = 1
+            session = ort.InferenceSession(int8_path, sess_options=options, providers=['CPUExecutionProvider'])
+
+            # Compare against the fp32 model before switching over
+            encoded = self.tokenizer(VALIDATION_TEXTS, padding=True, truncation=True,
+                                     max_length=self.max_length, return_tensors="np")
+            reference = self._run_batch(encoded["input_ids"], encoded["attention_mask"])
+            quantized = session.run(None, {
+                "input_ids": encoded["input_ids"].astype(np.int64),
+                "attention_mask": encoded["attention_mask"].astype(np.int64)
+            })[0][:, 0, :]
+            cosine = np.sum(reference * quantized, axis=1) / (
+                np.linalg.norm(reference, axis=1) * np.linalg.norm(quantized, axis=1))
+            if cosine.min() < INT8_MIN_COSINE:
+                print(f"INT8 model disagrees with fp32 (min cosine {cosine.min():.4f}). Using PyTorch on CPU.",
+                      file=sys.stderr)
+                return
+
+            print(f"Using INT8 ONNX Runtime on CPU (min cosine to fp32 {cosine.min():.4f}).", file=sys.stderr)
+            self.ort_session = session
+            self.model = None # Free memory
+        except Exception as e:
+            print(f"INT8 CPU setup failed: {e}. Using PyTorch on CPU.", file=sys.stderr)
+
     def embed(self, texts):
         if isinstance(texts, str):
             texts = [texts]
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+        if self.cache is None:
+            return self._infer(texts)
+
+        # Only texts missing from the cache go through the model
+        keys = [EmbeddingCache.key(self.model_name, self.revision, t, self.max_length) for t in texts]
+        cached = self.cache.get_many(keys)
+        missing = list(dict.fromkeys(k for k in keys if k not in cached))
+        if missing:
+            text_by_key = dict(zip(keys, texts))
+            fresh = self._infer([text_by_key[k] for k in missing])
+            computed = dict(zip(missing, fresh))
+            # NaN outputs signal a hardware problem; never persist them
+            self.cache.put_many((k, v) for k, v in computed.items() if not np.isnan(v).any())
+            cached.update(computed)
+
+        return np.stack([cached[k] for k in keys])
+
+    def embed_stream(self, texts, window=STREAM_WINDOW):
+        """
+        Embeds an iterable of texts as a three-stage pipeline, yielding
+        (index, vector) pairs in completion order. A tokenizer thread reads
+        and tokenizes the next batches, the inference thread runs the model,
+        and a post-processing thread checks for NaNs and writes the cache,
+        so the model is never waiting on the CPU-side work around it.
+        """
+        self.load()
+        stop = threading.Event()
+        tokenized = queue.Queue(maxsize=STREAM_DEPTH)
+        inferred = queue.Queue(maxsize=STREAM_DEPTH)
+        results = queue.Queue(maxsize=STREAM_DEPTH)
+        stats = {"infer_busy_s": 0.0, "infer_wait_s": 0.0, "batches": 0, "texts": 0, "cache_hits": 0}
+        self.stream_stats = stats
+
+        def put(q, item):
+            # Gives up once the consumer has gone away
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def tokenize():
+            try:
+                it = iter(texts)
+                start = 0
+                while not stop.is_set():
+                    window_texts = [t for _, t in zip(range(window), it)]
+                    if not window_texts:
+                        break
+                    indices = range(start, start + len(window_texts))
+                    start += len(window_texts)
 
-        inputs = self.tokenizer(texts, padding=True, truncation=True, return_tensors="pt", max_length=512)
+                    keys = [None] * len(window_texts)
+                    todo = list(range(len(window_texts)))
+                    if self.cache is not None:
+                        keys = [EmbeddingCache.key(self.model_name, self.revision, t, self.max_length) for t in window_texts]
+                        cached = self.cache.get_many(keys)
+                        hits = [i for i in todo if keys[i] in cached]
+                        if hits:
+                            stats["cache_hits"] += len(hits)
+                            # Already embedded: bypass the model, keep the batch ordering
+                            if not put(tokenized, ("cached", [indices[i] for i in hits], None,
+                                                   np.stack([cached[keys[i]] for i in hits]))):
+                                return
+                        todo = [i for i in todo if keys[i] not in cached]
+                    if not todo:
+                        continue
 
+                    encoded = self.tokenizer([window_texts[i] for i in todo], truncation=True, max_length=self.max_length)
+                    ids = encoded["input_ids"]
+                    order = sorted(range(len(todo)), key=lambda i: len(ids[i]))
+                    for batch in self._token_batches(order, [len(x) for x in ids]):
+                        padded = self.tokenizer.pad(
+                            {"input_ids": [ids[i] for i in batch],
+                             "attention_mask": [encoded["attention_mask"][i] for i in batch]},
+                            return_tensors="np"
+                        )
+                        if not put(tokenized, ("batch", [indices[todo[i]] for i in batch], [keys[todo[i]] for i in batch],
+                                               (padded["input_ids"], padded["attention_mask"]))):
+                            return
+                put(tokenized, None)
+            except Exception as e:
+                put(tokenized, e)
+
+        def infer():
+            try:
+                while not stop.is_set():
+                    waited = time.perf_counter()
+                    item = tokenized.get()
+                    started = time.perf_counter()
+                    stats["infer_wait_s"] += started - waited
+                    if item is None or isinstance(item, Exception):
+                        put(inferred, item)
+                        return
+                    kind, indices, keys, payload = item
+                    if kind == "batch":
+                        payload = self._run_batch(*payload)
+                        stats["infer_busy_s"] += time.perf_counter() - started
+                        stats["batches"] += 1
+                    if not put(inferred, (kind, indices, keys, payload)):
+                        return
+            except Exception as e:
+                put(inferred, e)
+
+        def postprocess():
+            try:
+                while not stop.is_set():
+                    item = inferred.get()
+                    if item is None or isinstance(item, Exception):
+                        put(results, item)
+                        return
+                    kind, indices, keys, vectors = item
+                    vectors = np.asarray(vectors, dtype=np.float32)
+                    if kind == "batch":
+                        nan_rows = np.isnan(vectors).any(axis=1)
+                        if nan_rows.any():
+                            print("Warning: Inference produced NaNs. This may be due to hardware issues.", file=sys.stderr)
+                        if self.cache is not None:
+                            # NaN outputs signal a hardware problem; never persist them
+                            self.cache.put_many((k, v) for k, v, bad in zip(keys, vectors, nan_rows) if not bad)
+                    stats["texts"] += len(indices)
+                    if not put(results, list(zip(indices, vectors))):
+                        return
+            except Exception as e:
+                put(results, e)
+
+        threads = [threading.Thread(target=stage, daemon=True, name=f"embed-{stage.__name__}")
+                   for stage in (tokenize, infer, postprocess)]
+        for t in threads:
+            t.start()
+        try:
+            while True:
+                item = results.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield from item
+        finally:
+            stop.set()
+            # Unblock stages waiting on an upstream queue that will never fill
+            for q in (tokenized, inferred):
+                try:
+                    q.put_nowait(None)
+                except queue.Full:
+                    pass
+            for t in threads:
+                t.join(timeout=1)
+            busy, wait = stats["infer_busy_s"], stats["infer_wait_s"]
+            stats["utilization"] = busy / (busy + wait) if busy + wait > 0 else 0.0
+
+    def _infer(self, texts):
+        """
+        Embeds texts in length-sorted batches whose padded size stays under
+        max_batch_tokens, so short titles are never padded to a long abstract.
+        Inputs are sorted within windows of SORT_WINDOW texts to bound memory.
+        """
+        self.load()
+        embeddings = []
+        for start in range(0, len(texts), SORT_WINDOW):
+            window = texts[start:start + SORT_WINDOW]
+            encoded = self.tokenizer(window, truncation=True, max_length=self.max_length)
+            ids = encoded["input_ids"]
+            order = sorted(range(len(window)), key=lambda i: len(ids[i]))
+
+            out = [None] * len(window)
+            for batch in self._token_batches(order, [len(x) for x in ids]):
+                padded = self.tokenizer.pad(
+                    {"input_ids": [ids[i] for i in batch], "attention_mask": [encoded["attention_mask"][i] for i in batch]},
+                    return_tensors="np"
+                )
+                vectors = self._run_batch(padded["input_ids"], padded["attention_mask"])
+                for i, vec in zip(batch, vectors):
+                    out[i] = vec
+            embeddings.append(np.stack(out))
+
+        embeddings = np.concatenate(embeddings) if embeddings else np.zeros((0, self.embedding_dim), dtype=np.float32)
+
+        # Check for NaNs
+        if np.isnan(embeddings).any():
+            print("Warning: Inference produced NaNs. This may be due to hardware issues.", file=sys.stderr)
+
+        return embeddings
+
+    def _token_batches(self, order, lengths):
+        """
+        Groups length-sorted indices so batch size * longest length <= max_batch_tokens.
+        """
+        batch = []
+        for i in order:
+            # Sorted ascending, so the newest item sets the padded length
+            if batch and (len(batch) + 1) * lengths[i] > self.max_batch_tokens:
+                yield batch
+                batch = []
+            batch.append(i)
+        if batch:
+            yield batch
+
+    def _run_batch(self, input_ids, attention_mask):
+        """
+        Runs one padded batch through the active backend and returns CLS vectors.
+        """
         if self.ort_session:
             ort_inputs = {
-                "input_ids": inputs["input_ids"].numpy(),
-                "attention_mask": inputs["attention_mask"].numpy()
+                "input_ids": input_ids.astype(np.int64),
+                "attention_mask": attention_mask.astype(np.int64)
             }
             res = self.ort_session.run(None, ort_inputs)
-            embeddings = res[0][:, 0, :] # CLS token
+            return res[0][:, 0, :] # CLS token
         elif self.ov_compiled_model:
             ov_inputs = {
-                "input_ids": inputs["input_ids"].numpy(),
-                "attention_mask": inputs["attention_mask"].numpy()
+                "input_ids": input_ids,
+                "attention_mask": attention_mask
             }
             res = self.ov_compiled_model(ov_inputs)
             output_node = self.ov_compiled_model.output(0)
-            embeddings = res[output_node][:, 0, :]
+            return res[output_node][:, 0, :]
         else:
+            import torch
             with torch.no_grad():
-                inputs = {k: v.to(self.device) for k, v in inputs.items()}
+                inputs = {
+                    "input_ids": torch.from_numpy(input_ids).to(self.device),
+                    "attention_mask": torch.from_numpy(attention_mask).to(self.device)
+                }
                 outputs = self.model(**inputs)
                 # CLS token
-                embeddings = outputs.last_hidden_state[:, 0, :].cpu().numpy()
-
-        # Check for NaNs
-        if np.isnan(embeddings).any():
-            print("Warning: Inference produced NaNs. This may be due to hardware issues.", file=sys.stderr)
-
-        return embeddings
+                return outputs.last_hidden_state[:, 0, :].cpu().numpy()
 
 if __name__ == "__main__":
     embedder = Embedder()
@@ -139,3 +481,5 @@ if __name__ == "__main__":
     emb = embedder.embed(test_text)
     print(f"Embedding shape: {emb.shape}")
     print(f"First 5 values: {emb[0][:5]}")
+    if embedder.cache:
+        print(f"Cache: {embedder.cache.stats()}")
@@ -1,90 +1,250 @@
 import numpy as np
-import networkx as nx
-from typing import List, Dict, Any
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+from xaptns.bridges import approximate_betweenness, similarity_to_distance, DEFAULT_PIVOTS
+
+# Papers more similar than this (cosine) are linked in the bridge graph
+SIMILARITY_THRESHOLD = 0.7
+# Rows/columns per tile of the pairwise similarity computation; peak memory is one tile
+SIMILARITY_BLOCK_SIZE = 2048
+# Nearest neighbors fetched per paper when expanding clusters through the ANN index
+DEFAULT_NEIGHBORS = 10
+# Most papers an expanded neighborhood graph may hold
+DEFAULT_NODE_BUDGET = 10_000
+# Neighbor lists kept in memory across bridge queries
+NEIGHBOR_CACHE_SIZE = 100_000
+
+def similarity_graph(vectors: np.ndarray, threshold: float = SIMILARITY_THRESHOLD,
+                     block_size: int = SIMILARITY_BLOCK_SIZE):
+    """
+    Sparse cosine-similarity graph: a symmetric SciPy CSR matrix holding the
+    similarity of every pair above threshold. Pairs are scored tile by tile
+    as products of L2-normalized blocks (upper triangle only), so memory is
+    bounded by block_size^2 plus the edges kept, never n^2.
+    """
+    from scipy.sparse import coo_matrix
+    vectors = np.asarray(vectors, dtype=np.float32)
+    n = len(vectors)
+    normed = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    rows, cols, sims = [], [], []
+    for i in range(0, n, block_size):
+        block_i = normed[i:i + block_size]
+        for j in range(i, n, block_size):
+            tile = block_i @ normed[j:j + block_size].T
+            if i == j:
+                # Diagonal tile: keep each pair once and drop self-similarity
+                tile = np.triu(tile, k=1)
+            r, c = np.nonzero(tile > threshold)
+            rows.append(r + i)
+            cols.append(c + j)
+            sims.append(tile[r, c])
+
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+    sims = np.concatenate(sims) if sims else np.zeros(0, dtype=np.float32)
+    upper = coo_matrix((sims, (rows, cols)), shape=(n, n))
+    return (upper + upper.T).tocsr()
+
+def knn_graph(paper_ids: List[str], neighbors: Dict[str, List[Tuple[str, float]]]):
+    """
+    Symmetric CSR similarity graph over paper_ids from precomputed neighbor
+    lists ({paper: [(neighbor, similarity)]}); neighbors outside paper_ids are dropped.
+    """
+    from scipy.sparse import coo_matrix
+    index = {pid: i for i, pid in enumerate(paper_ids)}
+    rows, cols, sims = [], [], []
+    for pid, hits in neighbors.items():
+        if pid not in index:
+            continue
+        for nbr, sim in hits:
+            if nbr in index and nbr != pid:
+                rows.append(index[pid])
+                cols.append(index[nbr])
+                sims.append(sim)
+    n = len(paper_ids)
+    directed = coo_matrix((np.asarray(sims, dtype=np.float32), (rows, cols)), shape=(n, n)).tocsr()
+    # a -> b or b -> a is enough for an undirected edge
+    return directed.maximum(directed.T).tocsr()
 
 class Navigator:
     """
     The Navigator: High-performance matrix operations for synthetic coordinates and bridge discovery.
     """
-    def __init__(self, vector_index=None):
+    def __init__(self, vector_index=None, neighbor_cache_size: int = NEIGHBOR_CACHE_SIZE):
         self.vector_index = vector_index
+        # arxiv_id -> [(neighbor, similarity)], most similar first; LRU ordered
+        self._neighbor_cache = OrderedDict()
+        self._neighbor_cache_size = neighbor_cache_size
+        self._neighbor_cache_len = None
 
     def calculate_centroid(self, vectors: List[np.ndarray], weights: List[float] = None) -> np.ndarray:
         """
         Calculates the Synthetic Interest Vector (Centroid).
-        V_C = (1/N) * sum(v_i) or weighted version.
+        V_C = (1/N) * sum(v_i / |v_i|) or weighted version. Vectors are
+        L2-normalized first so that papers with large norms do not dominate.
         """
         if not vectors:
             return None
 
-        vec_stack = np.stack(vectors)
+        vec_stack = np.stack(vectors).astype(np.float32)
+        vec_stack = vec_stack / np.maximum(np.linalg.norm(vec_stack, axis=1, keepdims=True), 1e-12)
         if weights is None:
             return np.mean(vec_stack, axis=0)
         else:
-            weights = np.array(weights)
+            weights = np.array(weights, dtype=np.float32)
+            if np.sum(weights) <= 0:
+                raise ValueError("Centroid weights must sum to a positive value")
             # Normalize weights
             weights = weights / np.sum(weights)
             return np.sum(vec_stack * weights[:, np.newaxis], axis=0)
 
-    def find_bridge_papers(self, cluster_a_ids: List[str], cluster_b_ids: List[str], top_k: int = 5) -> List[Dict[str, Any]]:
+    def search_centroids(self, id_sets: List[List[str]], vectors: Dict[str, np.ndarray],
+                         weight_sets: Optional[List[Optional[List[float]]]] = None, limit: int = 10,
+                         fields: Optional[List[str]] = None) -> List[Tuple[List[str], List[Dict[str, Any]]]]:
         """
-        Identifies "Bridge Papers" between two clusters using Betweenness Centrality.
-        Constructs a graph based on semantic similarity and finds nodes with high betweenness.
+        Answers many centroid queries with one batched index search.
+        id_sets holds one list of arXiv IDs per centroid, vectors maps IDs to
+        their vectors, and weight_sets optionally gives per-set weights
+        aligned with the IDs. Papers without a vector are left out. Returns,
+        per set, the IDs used and the nearest papers to its centroid.
         """
-        if not self.vector_index:
-            return []
+        weight_sets = weight_sets or [None] * len(id_sets)
+        if len(weight_sets) != len(id_sets):
+            raise ValueError("Expected one weight list per centroid")
 
-        # Combine all IDs
-        all_ids = list(set(cluster_a_ids + cluster_b_ids))
+        used, centroids = [], []
+        for ids, weights in zip(id_sets, weight_sets):
+            if weights is not None and len(weights) != len(ids):
+                raise ValueError(f"Got {len(weights)} weights for {len(ids)} papers")
+            keep = [i for i, aid in enumerate(ids) if aid in vectors]
+            used.append([ids[i] for i in keep])
+            centroids.append(self.calculate_centroid(
+                [vectors[ids[i]] for i in keep],
+                [weights[i] for i in keep] if weights is not None else None
+            ))
 
-        # We also want to include papers that might be bridges but not in the clusters
-        # For simplicity in this implementation, we'll build a graph of the clusters
-        # and their nearest neighbors from the index.
+        queried = [c for c in centroids if c is not None]
+        matches = iter(self.vector_index.search_many(np.stack(queried), limit=limit, fields=fields) if queried else [])
+        return [(ids, next(matches) if c is not None else []) for ids, c in zip(used, centroids)]
 
-        G = nx.Graph()
-
-        # Add nodes
-        for paper_id in all_ids:
-            G.add_node(paper_id)
+    def nearest_neighbors(self, paper_ids: List[str], k: int = DEFAULT_NEIGHBORS) -> Dict[str, List[Tuple[str, float]]]:
+        """
+        The k nearest stored papers to each of paper_ids, as {paper: [(neighbor, similarity)]}.
+        Misses are looked up with one get_vectors and one search_many call;
+        results are cached until the index changes size.
+        """
+        size = len(self.vector_index)
+        if size != self._neighbor_cache_len:
+            self._neighbor_cache.clear()
+            self._neighbor_cache_len = size
 
-        # For each paper, find its neighbors in the index and add edges
-        # This is a bit expensive if done via API, but we have a local index.
+        found, missing = {}, []
+        for pid in dict.fromkeys(paper_ids):
+            hits = self._neighbor_cache.get(pid)
+            # A longer cached list answers a smaller k
+            if hits is not None and (len(hits) >= k or len(hits) >= size - 1):
+                self._neighbor_cache.move_to_end(pid)
+                found[pid] = hits[:k]
+            else:
+                missing.append(pid)
 
-        # Let's assume we have vectors for these papers.
-        # If we don't, we'd need to fetch them.
+        if missing:
+            vectors = self.vector_index.get_vectors(missing)
+            queried = [pid for pid in missing if pid in vectors]
+            if queried:
+                # One extra result, since each paper finds itself first
+                results = self.vector_index.search_many(np.stack([vectors[pid] for pid in queried]),
+                                                        limit=k + 1, fields=[])
+                for pid, hits in zip(queried, results):
+                    hits = [(h["arxiv_id"], 1.0 - h["distance"]) for h in hits if h["arxiv_id"] != pid][:k]
+                    found[pid] = hits
+                    self._neighbor_cache[pid] = hits
+                while len(self._neighbor_cache) > self._neighbor_cache_size:
+                    self._neighbor_cache.popitem(last=False)
+        return found
 
-        # In a real scenario, we'd pull vectors from the DB.
-        self.vector_index.cursor.execute(f"SELECT arxiv_id, vector FROM papers WHERE arxiv_id IN ({','.join(['?']*len(all_ids))})", all_ids)
-        rows = self.vector_index.cursor.fetchall()
+    def expand_neighborhood(self, seed_ids: List[str], k: int = DEFAULT_NEIGHBORS, hops: int = 1,
+                            max_nodes: int = DEFAULT_NODE_BUDGET):
+        """
+        Grows seed_ids by their k nearest neighbors in the index, hop by hop,
+        adding the most similar newcomers first until max_nodes papers are
+        reached. Returns the paper list and the kNN similarity graph over it,
+        built from the ANN results rather than all-pairs similarity.
+        """
+        seeds = self.vector_index.contains(seed_ids)
+        nodes = dict.fromkeys(pid for pid in seed_ids if pid in seeds)
+        neighbors = {}
+        frontier = list(nodes)
+        for _ in range(hops):
+            if not frontier:
+                break
+            found = self.nearest_neighbors(frontier, k)
+            neighbors.update(found)
+            candidates = {}
+            for hits in found.values():
+                for nbr, sim in hits:
+                    if nbr not in nodes:
+                        candidates[nbr] = max(sim, candidates.get(nbr, -1.0))
+            room = max(max_nodes - len(nodes), 0)
+            frontier = sorted(candidates, key=candidates.get, reverse=True)[:room]
+            nodes.update(dict.fromkeys(frontier))
+        paper_list = list(nodes)
+        return paper_list, knn_graph(paper_list, neighbors)
 
-        paper_vectors = {row[0]: np.frombuffer(row[1], dtype=np.float32) for row in rows}
+    def find_bridge_papers(self, cluster_a_ids: List[str], cluster_b_ids: List[str], top_k: int = 5,
+                           k: Optional[int] = DEFAULT_PIVOTS, seed: int = 0, between_clusters: bool = False,
+                           workers: Optional[int] = None, neighbors: int = DEFAULT_NEIGHBORS, hops: int = 1,
+                           max_nodes: int = DEFAULT_NODE_BUDGET) -> List[Dict[str, Any]]:
+        """
+        Identifies "Bridge Papers" between two clusters using Betweenness Centrality.
+        The clusters are expanded through the vector index (neighbors nearest
+        papers per member, over hops, up to max_nodes papers), so a bridge
+        may be a paper in neither cluster; neighbors=0 uses only the given
+        papers, linked by all-pairs similarity. Edges are weighted by cosine
+        distance, and betweenness is estimated from k sampled pivots (k=None
+        is exact). With between_clusters=True only paths from cluster A to
+        cluster B are counted.
+        """
+        if not self.vector_index:
+            return []
 
-        # Build edges based on cosine similarity
-        paper_list = list(paper_vectors.keys())
-        for i in range(len(paper_list)):
-            for j in range(i + 1, len(paper_list)):
-                id_i = paper_list[i]
-                id_j = paper_list[j]
-                v_i = paper_vectors[id_i]
-                v_j = paper_vectors[id_j]
+        # Combine all IDs
+        all_ids = list(dict.fromkeys(cluster_a_ids + cluster_b_ids))
 
-                # Cosine similarity
-                sim = np.dot(v_i, v_j) / (np.linalg.norm(v_i) * np.linalg.norm(v_j))
-                if sim > 0.7: # Threshold for connection
-                    G.add_edge(id_i, id_j, weight=float(sim))
+        if neighbors:
+            paper_list, adjacency = self.expand_neighborhood(all_ids, k=neighbors, hops=hops, max_nodes=max_nodes)
+            if not paper_list:
+                return []
+        else:
+            paper_vectors = self.vector_index.get_vectors(all_ids)
+            if not paper_vectors:
+                return []
+            paper_list = list(paper_vectors.keys())
+            # Link papers whose cosine similarity exceeds the threshold
+            adjacency = similarity_graph(np.stack([paper_vectors[pid] for pid in paper_list]))
 
-        # Calculate betweenness centrality
-        centrality = nx.betweenness_centrality(G, weight='weight')
+        sources = targets = None
+        if between_clusters:
+            index = {pid: i for i, pid in enumerate(paper_list)}
+            sources = [index[pid] for pid in cluster_a_ids if pid in index]
+            targets = [index[pid] for pid in cluster_b_ids if pid in index]
+            if not sources or not targets:
+                return []
 
-        # Sort by centrality
-        sorted_centrality = sorted(centrality.items(), key=lambda x: x[1], reverse=True)
+        scores, errors = approximate_betweenness(similarity_to_distance(adjacency), k=k, seed=seed,
+                                                 sources=sources, targets=targets, workers=workers)
 
         # Return top K
         bridges = []
-        for paper_id, score in sorted_centrality[:top_k]:
+        for i in np.argsort(-scores, kind="stable")[:top_k]:
+            # No shortest path runs through it (e.g. the clusters are not connected)
+            if scores[i] <= 0:
+                break
             bridges.append({
-                "arxiv_id": paper_id,
-                "centrality_score": score
+                "arxiv_id": paper_list[i],
+                "centrality_score": float(scores[i]),
+                "centrality_error": float(errors[i])
             })
 
         return bridges
@@ -0,0 +1,200 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import sys
+from multiprocessing import shared_memory
+import numpy as np
+from xaptns.model import Embedder, DEFAULT_MAX_BATCH_TOKENS
+
+# Texts per task handed to a worker; small enough to balance load across workers
+DEFAULT_CHUNK_SIZE = 256
+# Seconds between liveness checks while waiting on workers
+POLL_INTERVAL = 1.0
+
+def _worker_main(worker_id, model_name, max_length, max_batch_tokens, cpu_backend, num_threads, cores, tasks, results):
+    """
+    Worker process: loads its own Embedder with a fixed thread count, then
+    embeds chunks from the task queue straight into the caller's shared memory.
+    """
+    # Set before torch/onnxruntime load so their thread pools are sized once
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(num_threads)
+    # Tokenizers run in this process; their own thread pool would oversubscribe the cores
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    try:
+        embedder = Embedder(model_name, max_length=max_length, cache=False, max_batch_tokens=max_batch_tokens,
+                            cpu_backend=cpu_backend, num_threads=num_threads)
+        dim = embedder.embed(["warmup"]).shape[1]
+    except Exception as e:
+        results.put(("failed", worker_id, f"{type(e).__name__}: {e}"))
+        return
+    results.put(("ready", worker_id, dim))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        job_id, shm_name, offset, texts = task
+        try:
+            vectors = embedder.embed(texts)
+            shm = shared_memory.SharedMemory(name=shm_name)
+            try:
+                out = np.ndarray((len(texts), dim), dtype=np.float32, buffer=shm.buf, offset=offset * dim * 4)
+                out[:] = vectors
+                del out
+            finally:
+                shm.close()
+            results.put(("done", job_id, len(texts)))
+        except Exception as e:
+            results.put(("error", job_id, f"{type(e).__name__}: {e}"))
+
+class EmbedderPool(Embedder):
+    """
+    Embeds through N worker processes, each holding its own Embedder pinned
+    to its own share of the cores, so tokenization and inference scale past
+    one process. Misses are split into chunks and spread over the workers,
+    which write vectors directly into a shared memory block instead of
+    pickling them back. The embedding cache is consulted in this process,
+    as for a plain Embedder, so embed(texts) behaves the same.
+    """
+    def __init__(self, model_name="allenai/specter2_base", num_workers=None, threads_per_worker=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, max_length=512, cache=True, cache_max_entries=1_000_000,
+                 max_batch_tokens=DEFAULT_MAX_BATCH_TOKENS, cpu_backend="onnx-int8"):
+        super().__init__(model_name, max_length=max_length, cache=cache, cache_max_entries=cache_max_entries,
+                         max_batch_tokens=max_batch_tokens, cpu_backend=cpu_backend)
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        self.num_workers = num_workers or max(1, len(cores) // 4)
+        self.num_threads = threads_per_worker or max(1, len(cores) // self.num_workers)
+        self.chunk_size = chunk_size
+        self.dim = None
+        self._cores = cores
+        self._ctx = mp.get_context("spawn")
+        self._tasks = None
+        self._results = None
+        self._workers = []
+        self._next_job = 0
+
+    def load(self):
+        """
+        Starts the workers and waits until every one has loaded its model.
+        """
+        if self._loaded:
+            return
+        self._tasks = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        print(f"Starting {self.num_workers} embedding workers x {self.num_threads} threads...", file=sys.stderr)
+        # The first worker exports/quantizes the model into .model_cache on its own;
+        # the rest start after it and reuse those files instead of racing to write them
+        self._start_worker(0)
+        self._wait_ready(1)
+        for i in range(1, self.num_workers):
+            self._start_worker(i)
+        self._wait_ready(self.num_workers - 1)
+        self._loaded = True
+
+    def _start_worker(self, worker_id):
+        cores = None
+        if len(self._cores) >= self.num_workers * self.num_threads:
+            cores = self._cores[worker_id * self.num_threads:(worker_id + 1) * self.num_threads]
+        proc = self._ctx.Process(
+            target=_worker_main, daemon=True, name=f"xaptns-embedder-{worker_id}",
+            args=(worker_id, self.model_name, self.max_length, self.max_batch_tokens, self.cpu_backend,
+                  self.num_threads, cores, self._tasks, self._results)
+        )
+        proc.start()
+        self._workers.append(proc)
+
+    def _wait_ready(self, count):
+        for _ in range(count):
+            kind, worker_id, payload = self._next_result()
+            if kind != "ready":
+                self.close()
+                raise RuntimeError(f"Embedding worker {worker_id} failed to start: {payload}")
+            self.dim = payload
+
+    def _next_result(self):
+        """
+        Blocks for the next worker message, failing if a worker died silently.
+        """
+        while True:
+            try:
+                return self._results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                dead = [p.name for p in self._workers if not p.is_alive()]
+                if dead:
+                    self.close()
+                    raise RuntimeError(f"Embedding workers exited unexpectedly: {dead}")
+
+    def _infer(self, texts):
+        """
+        Scatters texts over the workers in chunks and gathers the vectors
+        from shared memory, in input order.
+        """
+        self.load()
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+
+        shm = shared_memory.SharedMemory(create=True, size=len(texts) * self.dim * 4)
+        try:
+            jobs = set()
+            for offset in range(0, len(texts), self.chunk_size):
+                job_id = self._next_job
+                self._next_job += 1
+                jobs.add(job_id)
+                self._tasks.put((job_id, shm.name, offset, texts[offset:offset + self.chunk_size]))
+
+            errors = []
+            while jobs:
+                kind, job_id, payload = self._next_result()
+                if job_id not in jobs:
+                    continue
+                jobs.discard(job_id)
+                if kind == "error":
+                    errors.append(payload)
+            if errors:
+                raise RuntimeError(f"Embedding failed in {len(errors)} chunk(s): {errors[0]}")
+
+            return np.ndarray((len(texts), self.dim), dtype=np.float32, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def embed_stream(self, texts, window=None):
+        """
+        Streams (index, vector) pairs, embedding one window of
+        chunk_size * num_workers texts at a time so every worker stays busy.
+        """
+        window = window or self.chunk_size * self.num_workers
+        it = iter(texts)
+        start = 0
+        while True:
+            chunk = list(itertools.islice(it, window))
+            if not chunk:
+                break
+            for i, vec in enumerate(self.embed(chunk)):
+                yield start + i, vec
+            start += len(chunk)
+
+    def close(self):
+        """
+        Stops the workers.
+        """
+        for _ in self._workers:
+            self._tasks.put(None)
+        for proc in self._workers:
+            proc.join(timeout=10)
+            if proc.is_alive():
+                proc.terminate()
+        self._workers = []
+        self._loaded = False
+
+if __name__ == "__main__":
+    pool = EmbedderPool(num_workers=2)
+    texts = [f"Paper {i}: The Semantic Scholar Open Data Platform" for i in range(100)]
+    emb = pool.embed(texts)
+    print(f"Embedding shape: {emb.shape}")
+    pool.close()
@@ -1,77 +1,865 @@
 from usearch.index import Index
+from xaptns.exact import ExactIndex
 import numpy as np
 import sys
 import sqlite3
 import json
 import os
+import queue
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+REBUILD_BATCH_SIZE = 10000
+# SQLite's default bound-parameter limit on older builds
+SQLITE_MAX_VARIABLES = 999
+# Bumped whenever _init_db learns a new migration
+SCHEMA_VERSION = 3
+# Metadata keys stored as typed columns of the papers table; anything else goes to `extra` as JSON
+METADATA_COLUMNS = {
+    "title": "title",
+    "abstract": "abstract",
+    "authors": "authors",
+    "year": "year",
+    "categories": "categories",
+    "paperId": "s2_paper_id",
+}
+# Columns holding JSON-encoded lists, decoded again on read
+JSON_COLUMNS = {"authors", "categories"}
+# Filters matching at most this many papers are answered by an exact scan of their vectors
+FILTER_EXACT_MAX_ROWS = 20000
+# Over-fetch rounds (each doubling the candidate count) before a broad filter falls back to the exact scan
+FILTER_MAX_ROUNDS = 4
+# With backend="auto", corpora up to this size use exact brute-force search instead of HNSW
+EXACT_BACKEND_MAX_ROWS = 20000
+# Candidates fetched per requested hit by the b1 first stage before exact rerank
+DEFAULT_OVERSAMPLE = 10
+
+class ReadConnectionPool:
+    """
+    A bounded pool of read-only SQLite connections shared across threads.
+    With the database in WAL mode, readers never block behind the writer.
+    """
+    def __init__(self, db_path, size=4):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def cursor(self):
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            try:
+                yield conn.cursor()
+            finally:
+                self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+def split_metadata(metadata):
+    """
+    Splits a metadata dict into the typed papers columns plus the JSON remainder.
+    Author and category lists are stored as JSON arrays; a year that is not
+    a number is stored as NULL.
+    """
+    metadata = dict(metadata or {})
+    values = [metadata.pop(key, None) for key in METADATA_COLUMNS]
+    authors, year, categories = values[2], values[3], values[4]
+    if authors is not None:
+        values[2] = json.dumps(list(authors) if isinstance(authors, tuple) else authors, ensure_ascii=False)
+    if year is not None:
+        try:
+            values[3] = int(year)
+        except (TypeError, ValueError):
+            values[3] = None
+    if categories is not None:
+        values[4] = json.dumps(categories.split() if isinstance(categories, str) else list(categories))
+    return tuple(values) + (json.dumps(metadata) if metadata else None,)
+
+def pack_sign_bits(vectors):
+    """
+    Binarizes float vectors to their sign bits, packed 8 per byte for a b1 index.
+    """
+    return np.packbits(np.asarray(vectors) > 0, axis=-1)
+
+def cosine_distances(queries, vectors):
+    """
+    Exact cosine distance (1 - cos) between every query and every vector.
+    """
+    q = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    v = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return 1.0 - q @ v.T
 
 class VectorIndex:
-    def __init__(self, dim=768, db_path="xaptns.db"):
+    def __init__(self, dim=768, db_path="xaptns.db", index_path=None, read_only=False, commit_interval=1,
+                 quantization="i8", oversample=DEFAULT_OVERSAMPLE, read_pool_size=4,
+                 backend="auto", connectivity=None, expansion_search=None):
+        if quantization not in ("i8", "b1"):
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        if backend not in ("auto", "hnsw", "exact"):
+            raise ValueError(f"Unsupported backend: {backend}")
         self.dim = dim
         self.db_path = db_path
-        # USearch with binary quantization (i8 or b1) for memory savings
-        self.index = Index(ndim=dim, metric='cos', dtype='i8')
+        # "i8" keeps a cosine index; "b1" keeps only sign bits (Hamming) and
+        # reranks `oversample * limit` candidates against the stored float32 vectors
+        self.quantization = quantization
+        self.oversample = oversample
+        # "exact" does brute-force cosine over a float32 matrix, "hnsw" uses USearch,
+        # and "auto" picks exact up to EXACT_BACKEND_MAX_ROWS papers, then switches to HNSW
+        self.backend = backend
+        self.connectivity = connectivity
+        self.expansion_search = expansion_search
+        # The ANN index lives next to the database, e.g. xaptns.db -> xaptns.usearch
+        suffix = ".b1.usearch" if quantization == "b1" else ".usearch"
+        self.index_path = index_path or os.path.splitext(db_path)[0] + suffix
+        self.read_only = read_only
+        # Streaming callers can batch commits: writes are committed once this many rows are pending
+        self.commit_interval = commit_interval
+        self._pending_writes = 0
+        self._dirty = False
+        # self.conn is the single writer; searches and lookups go through the reader pool
+        self._write_lock = threading.RLock()
+        # Guards the USearch index against searching while add() grows it
+        self._index_lock = threading.RLock()
         self._init_db()
+        self.readers = ReadConnectionPool(self.db_path, size=read_pool_size)
+        self.index = self._load_index()
 
     def _init_db(self):
-        self.conn = sqlite3.connect(self.db_path)
+        if self.read_only:
+            self.conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
         self.cursor = self.conn.cursor()
+        self.cursor.execute("PRAGMA user_version")
+        version = self.cursor.fetchone()[0]
+        if self.read_only:
+            # A read-only handle cannot migrate, and the old schemas lack the tables queried below
+            if version < SCHEMA_VERSION:
+                self.conn.close()
+                raise RuntimeError(
+                    f"Database {self.db_path} needs migration (schema version {version}, expected "
+                    f"{SCHEMA_VERSION}); open it once with read_only=False to migrate it"
+                )
+            return
+
+        # WAL lets the reader pool keep serving while ingestion commits
+        self.cursor.execute("PRAGMA journal_mode=WAL")
+        self.cursor.execute("PRAGMA synchronous=NORMAL")
+        self.cursor.execute("PRAGMA table_info(papers)")
+        legacy = "metadata" in [col[1] for col in self.cursor.fetchall()]
+        if legacy:
+            self.cursor.execute("ALTER TABLE papers RENAME TO papers_legacy")
+
+        # Metadata lives in typed columns; the 3 KB vectors are kept in their own
+        # table so metadata scans and lookups never page through BLOBs
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS papers (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 arxiv_id TEXT UNIQUE,
-                metadata TEXT,
+                title TEXT,
+                abstract TEXT,
+                authors TEXT,
+                year INTEGER,
+                categories TEXT,
+                s2_paper_id TEXT,
+                extra TEXT
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS paper_vectors (
+                id INTEGER PRIMARY KEY REFERENCES papers(id),
                 vector BLOB
             )
         ''')
+        # One row per (paper, category) so category filters can use an index
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS paper_categories (
+                id INTEGER REFERENCES papers(id),
+                category TEXT,
+                PRIMARY KEY (category, id)
+            ) WITHOUT ROWID
+        ''')
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_papers_year ON papers(year)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_papers_s2_paper_id ON papers(s2_paper_id)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_paper_categories_id ON paper_categories(id)")
+        self.cursor.execute("DROP INDEX IF EXISTS idx_papers_categories")
+
+        if legacy:
+            self._migrate_legacy()
+        elif version < 3:
+            self._encode_list_columns()
+        if version < 2:
+            self.cursor.execute("SELECT id, categories FROM papers WHERE categories IS NOT NULL")
+            self._index_categories(self.cursor.fetchall())
+        self.cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         self.conn.commit()
 
+    def _migrate_legacy(self):
+        """
+        Moves rows from the original (arxiv_id, metadata JSON, vector) schema
+        into the columnar tables, keeping row ids so index keys stay valid.
+        """
+        print(f"Migrating {self.db_path} to the columnar paper schema...", file=sys.stderr)
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT id, arxiv_id, metadata, vector FROM papers_legacy ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(REBUILD_BATCH_SIZE)
+            if not rows:
+                break
+            self.cursor.executemany(
+                "INSERT INTO papers (id, arxiv_id, title, abstract, authors, year, categories, s2_paper_id, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(row[0], row[1]) + split_metadata(json.loads(row[2]) if row[2] else None) for row in rows]
+            )
+            self.cursor.executemany(
+                "INSERT INTO paper_vectors (id, vector) VALUES (?, ?)",
+                [(row[0], row[3]) for row in rows]
+            )
+        self.cursor.execute("DROP TABLE papers_legacy")
+
+    def _encode_list_columns(self):
+        """
+        Rewrites the flattened text authors and categories of schema version 2
+        as JSON. Categories split back into a list; the original author list
+        cannot be recovered from the joined text, so it is kept as one string.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT id, authors, categories FROM papers WHERE authors IS NOT NULL OR categories IS NOT NULL")
+        while True:
+            rows = cursor.fetchmany(REBUILD_BATCH_SIZE)
+            if not rows:
+                break
+            self.cursor.executemany(
+                "UPDATE papers SET authors = ?, categories = ? WHERE id = ?",
+                [(json.dumps(authors, ensure_ascii=False) if authors is not None else None,
+                  json.dumps(categories.split()) if categories is not None else None, row_id)
+                 for row_id, authors, categories in rows]
+            )
+
+    def _index_categories(self, rows):
+        """
+        Rewrites paper_categories for (row id, JSON category list) pairs.
+        """
+        row_ids = [row[0] for row in rows]
+        for start in range(0, len(row_ids), SQLITE_MAX_VARIABLES):
+            chunk = row_ids[start:start + SQLITE_MAX_VARIABLES]
+            self.cursor.execute(
+                f"DELETE FROM paper_categories WHERE id IN ({','.join(['?'] * len(chunk))})", chunk
+            )
+        self.cursor.executemany(
+            "INSERT OR IGNORE INTO paper_categories (id, category) VALUES (?, ?)",
+            [(row_id, cat) for row_id, cats in rows if cats for cat in json.loads(cats)]
+        )
+
+    def _new_index(self):
+        # USearch with binary quantization (i8 or b1) for memory savings
+        if self.quantization == "b1":
+            return Index(ndim=self.dim, metric='hamming', dtype='b1',
+                         connectivity=self.connectivity, expansion_search=self.expansion_search)
+        return Index(ndim=self.dim, metric='cos', dtype='i8',
+                     connectivity=self.connectivity, expansion_search=self.expansion_search)
+
+    def _use_exact(self, count):
+        return self.backend == "exact" or (self.backend == "auto" and count <= EXACT_BACKEND_MAX_ROWS)
+
+    def _encode(self, vectors, index=None):
+        """
+        Converts float32 vectors to what the index stores.
+        """
+        index = self.index if index is None else index
+        if self.quantization == "b1" and not isinstance(index, ExactIndex):
+            return pack_sign_bits(vectors)
+        return vectors
+
+    def _load_index(self):
+        """
+        Opens the persisted USearch index, memory-mapped for read-only workers,
+        and rebuilds it from the SQLite vectors if it is missing or stale.
+        Small corpora get an in-memory ExactIndex, which is cheap to rebuild.
+        """
+        self.cursor.execute("SELECT COUNT(*) FROM paper_vectors")
+        if self._use_exact(self.cursor.fetchone()[0]):
+            index = ExactIndex(self.dim)
+            self._rebuild(index)
+            return index
+
+        if os.path.exists(self.index_path):
+            try:
+                index = Index.restore(self.index_path, view=self.read_only)
+                if (index is not None and index.ndim == self.dim
+                        and index.dtype.name.lower() == self.quantization and self._is_consistent(index)):
+                    return index
+                print(f"Index file {self.index_path} is stale, rebuilding from {self.db_path}...", file=sys.stderr)
+            except Exception as e:
+                print(f"Error loading index file {self.index_path}: {e}. Rebuilding...", file=sys.stderr)
+
+        index = self._new_index()
+        self._rebuild(index)
+        return index
+
+    def _is_consistent(self, index):
+        """
+        Checks that the index holds exactly the stored vectors.
+        """
+        self.cursor.execute("SELECT COUNT(*), MAX(id) FROM paper_vectors")
+        count, max_id = self.cursor.fetchone()
+        if len(index) != count:
+            return False
+        return max_id is None or index.contains(max_id)
+
+    def _rebuild(self, index):
+        """
+        Bulk-loads every stored vector into the index, in batches.
+        """
+        self.cursor.execute("SELECT COUNT(*) FROM paper_vectors")
+        if self.cursor.fetchone()[0] == 0:
+            return
+
+        print(f"Rebuilding vector index from {self.db_path}...", file=sys.stderr)
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT id, vector FROM paper_vectors ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(REBUILD_BATCH_SIZE)
+            if not rows:
+                break
+            keys = np.array([row[0] for row in rows], dtype=np.uint64)
+            vectors = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32).reshape(len(rows), self.dim)
+            index.add(keys, self._encode(vectors, index))
+        print(f"Rebuilt vector index with {len(index)} papers.", file=sys.stderr)
+
+        if not self.read_only and not isinstance(index, ExactIndex):
+            self._dirty = True
+            self.save(index)
+
+    def save(self, index=None):
+        """
+        Persists the ANN index next to the database.
+        """
+        if index is None:
+            index = self.index
+        if self.read_only:
+            return
+        if isinstance(index, ExactIndex):
+            # Nothing to persist: the exact backend is rebuilt from SQLite on open
+            self._dirty = False
+            return
+        with self._index_lock:
+            index.save(self.index_path)
+        self._dirty = False
+
+    def close(self):
+        """
+        Saves pending index changes and closes the database connection.
+        """
+        self.flush()
+        if self._dirty:
+            self.save()
+        self.readers.close()
+        self.conn.close()
+
     def add(self, arxiv_id, vector, metadata=None):
         """
         Adds a vector to the index and SQLite.
         """
         vector_flat = vector.flatten().astype(np.float32)
+        self.add_many([arxiv_id], vector_flat.reshape(1, -1), [metadata])
 
-        # Add to SQLite
-        meta_json = json.dumps(metadata) if metadata else "{}"
-        try:
-            self.cursor.execute(
-                "INSERT OR REPLACE INTO papers (arxiv_id, metadata, vector) VALUES (?, ?, ?)",
-                (arxiv_id, meta_json, vector_flat.tobytes())
-            )
-            # If it was a REPLACE, lastrowid might be the new ID or the old one depending on SQLite version
-            # To be safe, let's get the ID of the inserted arxiv_id
-            self.cursor.execute("SELECT id FROM papers WHERE arxiv_id = ?", (arxiv_id,))
-            row_id = self.cursor.fetchone()[0]
+    def add_many(self, arxiv_ids, vectors, metadatas=None, threads=0):
+        """
+        Adds a batch of vectors in one SQLite transaction and one USearch call.
+        vectors is an (N, dim) matrix aligned with arxiv_ids; threads=0 lets
+        USearch use every core. Returns True once the batch is stored, False
+        if it failed and was rolled back.
+        """
+        if self.read_only:
+            print(f"Error adding to index: {self.db_path} is opened read-only", file=sys.stderr)
+            return False
+
+        arxiv_ids = list(arxiv_ids)
+        if not arxiv_ids:
+            return True
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(arxiv_ids), self.dim)
+        if metadatas is None:
+            metadatas = [None] * len(arxiv_ids)
+
+        # A paper repeated within the batch keeps its last vector
+        latest = {aid: i for i, aid in enumerate(arxiv_ids)}
+        if len(latest) < len(arxiv_ids):
+            positions = sorted(latest.values())
+            arxiv_ids = [arxiv_ids[i] for i in positions]
+            metadatas = [metadatas[i] for i in positions]
+            vectors = vectors[positions]
+
+        with self._write_lock:
+            # Earlier uncommitted batches share the open transaction; a savepoint
+            # lets a failing batch undo only its own writes
+            if not self.conn.in_transaction:
+                self.conn.execute("BEGIN")
+            self.conn.execute("SAVEPOINT add_many")
+            keys = existing = None
+            try:
+                rows = [(aid,) + split_metadata(meta) for aid, meta in zip(arxiv_ids, metadatas)]
+                # Upsert keeps the existing row id, so the persisted index key stays valid
+                self.cursor.executemany(
+                    "INSERT INTO papers (arxiv_id, title, abstract, authors, year, categories, s2_paper_id, extra) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(arxiv_id) DO UPDATE SET "
+                    "title = excluded.title, abstract = excluded.abstract, authors = excluded.authors, "
+                    "year = excluded.year, categories = excluded.categories, "
+                    "s2_paper_id = excluded.s2_paper_id, extra = excluded.extra",
+                    rows
+                )
+                row_ids = self._lookup_row_ids(arxiv_ids)
+                self.cursor.executemany(
+                    "INSERT INTO paper_vectors (id, vector) VALUES (?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET vector = excluded.vector",
+                    [(row_ids[aid], vec.tobytes()) for aid, vec in zip(arxiv_ids, vectors)]
+                )
+                self._index_categories([(row_ids[row[0]], row[5]) for row in rows])
+
+                # Add to USearch (requires integer keys)
+                keys = np.array([row_ids[aid] for aid in arxiv_ids], dtype=np.uint64)
+                with self._index_lock:
+                    existing = keys[np.asarray(self.index.contains(keys), dtype=bool).reshape(-1)]
+                    if len(existing):
+                        self.index.remove(existing)
+                    self.index.add(keys, self._encode(vectors), threads=threads)
+                self.conn.execute("RELEASE add_many")
+            except Exception as e:
+                self.conn.execute("ROLLBACK TO add_many")
+                self.conn.execute("RELEASE add_many")
+                if keys is not None:
+                    self._restore_index(keys, existing)
+                print(f"Error adding to index: {e}", file=sys.stderr)
+                return False
+
+            self._pending_writes += len(rows)
+            self._dirty = True
+            if self._pending_writes >= self.commit_interval:
+                self.flush()
+        if isinstance(self.index, ExactIndex) and not self._use_exact(len(self.index)):
+            self._promote()
+        return True
+
+    def _restore_index(self, keys, existing):
+        """
+        Undoes a failed add_many on the ANN index: drops the batch's keys and
+        re-adds the vectors of papers it was replacing, as rolled back in SQLite.
+        """
+        with self._index_lock:
+            present = keys[np.asarray(self.index.contains(keys), dtype=bool).reshape(-1)]
+            if len(present):
+                self.index.remove(present)
+            if existing is None or not len(existing):
+                return
+            restored = {}
+            for start in range(0, len(existing), SQLITE_MAX_VARIABLES):
+                chunk = [int(k) for k in existing[start:start + SQLITE_MAX_VARIABLES]]
+                self.cursor.execute(
+                    f"SELECT id, vector FROM paper_vectors WHERE id IN ({','.join(['?'] * len(chunk))})", chunk
+                )
+                restored.update((row_id, np.frombuffer(blob, dtype=np.float32)) for row_id, blob in self.cursor.fetchall())
+            if restored:
+                self.index.add(np.array(list(restored), dtype=np.uint64), self._encode(np.stack(list(restored.values()))))
+
+    def _promote(self):
+        """
+        Replaces the exact backend with an HNSW index once the corpus outgrows it.
+        """
+        print(f"Corpus exceeds {EXACT_BACKEND_MAX_ROWS} papers, building HNSW index...", file=sys.stderr)
+        with self._index_lock:
+            exact = self.index
+            index = self._new_index()
+            index.add(exact.keys.copy(), self._encode(exact.vectors, index))
+            self.index = index
+        self.save()
+
+    def _lookup_row_ids(self, arxiv_ids):
+        """
+        Resolves arXiv IDs to row ids, chunked to stay under SQLite's variable limit.
+        Runs on the writer connection so it sees not-yet-committed rows.
+        """
+        row_ids = {}
+        with self._write_lock:
+            for start in range(0, len(arxiv_ids), SQLITE_MAX_VARIABLES):
+                chunk = arxiv_ids[start:start + SQLITE_MAX_VARIABLES]
+                self.cursor.execute(
+                    f"SELECT arxiv_id, id FROM papers WHERE arxiv_id IN ({','.join(['?'] * len(chunk))})",
+                    chunk
+                )
+                row_ids.update(self.cursor.fetchall())
+        return row_ids
+
+    @contextmanager
+    def _read_cursor(self):
+        """
+        A cursor for lookups. The reader pool only sees committed rows, so
+        while commit_interval holds writes back, reads go through the writer
+        connection instead and see the pending rows too.
+        """
+        if self._pending_writes:
+            with self._write_lock:
+                if self._pending_writes:
+                    yield self.conn.cursor()
+                    return
+        with self.readers.cursor() as cursor:
+            yield cursor
+
+    def contains(self, arxiv_ids):
+        """
+        Returns the subset of arxiv_ids already stored.
+        """
+        return set(self._lookup_row_ids(list(arxiv_ids)))
+
+    def flush(self):
+        """
+        Commits writes held back by commit_interval.
+        """
+        if self.read_only:
+            return
+        with self._write_lock:
             self.conn.commit()
+            self._pending_writes = 0
 
-            # Add to USearch (requires integer key)
-            self.index.add(row_id, vector_flat)
-        except Exception as e:
-            print(f"Error adding to index: {e}", file=sys.stderr)
+    def get_vectors(self, arxiv_ids):
+        """
+        Returns {arxiv_id: float32 vector} for the stored papers among arxiv_ids.
+        """
+        arxiv_ids = list(arxiv_ids)
+        vectors = {}
+        with self._read_cursor() as cursor:
+            for start in range(0, len(arxiv_ids), SQLITE_MAX_VARIABLES):
+                chunk = arxiv_ids[start:start + SQLITE_MAX_VARIABLES]
+                cursor.execute(
+                    "SELECT p.arxiv_id, v.vector FROM papers p JOIN paper_vectors v ON v.id = p.id "
+                    f"WHERE p.arxiv_id IN ({','.join(['?'] * len(chunk))})",
+                    chunk
+                )
+                for arxiv_id, blob in cursor.fetchall():
+                    vectors[arxiv_id] = np.frombuffer(blob, dtype=np.float32)
+        return vectors
 
-    def search(self, vector, limit=10):
+    def get_metadata(self, arxiv_ids, fields=None):
+        """
+        Returns {arxiv_id: metadata dict} for the stored papers among arxiv_ids,
+        restricted to fields when given.
+        """
+        return dict(self._fetch_rows(arxiv_ids, fields, key_column="arxiv_id").values())
+
+    def __len__(self):
+        return len(self.index)
+
+    def search(self, vector, limit=10, fields=None, where=None):
         """
         Searches for the nearest neighbors.
         """
         vector_flat = vector.flatten().astype(np.float32)
-        if len(self.index) == 0:
-            return []
+        return self.search_many(vector_flat.reshape(1, -1), limit=limit, fields=fields, where=where)[0]
+
+    def search_many(self, vectors, limit=10, threads=0, fields=None, where=None):
+        """
+        Searches a batch of query vectors at once. Returns one result list per
+        query; metadata for all hits is fetched with a single lookup.
+        fields restricts the metadata to those keys (e.g. ["title"]);
+        by default every stored key is returned.
+        where filters on paper metadata, e.g.
+        {"categories": ["cs.LG"], "year_min": 2021, "authors": "Bengio"}.
+        """
+        queries = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if len(self.index) == 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+
+        # A where dict whose predicates are all None or empty filters nothing
+        condition, params = self._filter_sql(where or {})
+        if condition:
+            keys, distances, counts = self._search_filtered(queries, limit, condition, params, threads)
+        else:
+            keys, distances, counts = self._search_candidates(queries, limit, threads)
+
+        hit_keys = {int(k) for q in range(len(queries)) for k in keys[q, :counts[q]]}
+        rows = self._fetch_rows(hit_keys, fields)
 
-        matches = self.index.search(vector_flat, limit)
         results = []
-        for match in matches:
-            key = int(match.key)
-            self.cursor.execute("SELECT arxiv_id, metadata FROM papers WHERE id = ?", (key,))
-            row = self.cursor.fetchone()
-            if row:
-                results.append({
-                    "arxiv_id": row[0],
-                    "metadata": json.loads(row[1]),
-                    "distance": float(match.distance)
-                })
+        for q in range(len(queries)):
+            hits = []
+            for key, distance in zip(keys[q, :counts[q]], distances[q, :counts[q]]):
+                row = rows.get(int(key))
+                if row:
+                    hits.append({
+                        "arxiv_id": row[0],
+                        "metadata": row[1],
+                        "distance": float(distance)
+                    })
+            results.append(hits)
         return results
 
+    def _search_candidates(self, queries, count, threads=0):
+        """
+        Unfiltered top-count search through whichever index is active.
+        """
+        if self.quantization == "b1" and not isinstance(self.index, ExactIndex):
+            return self._search_b1(queries, count, threads)
+        return self._search_index(queries, count, threads)
+
+    def _filter_sql(self, where):
+        """
+        Translates a where dict into a SQL condition on papers plus its
+        parameters. The condition is None when no predicate is set.
+        """
+        clauses, params = [], []
+        for key, value in where.items():
+            if value is None or value == [] or value == "":
+                continue
+            if key == "categories":
+                cats = [value] if isinstance(value, str) else list(value)
+                clauses.append(
+                    f"id IN (SELECT id FROM paper_categories WHERE category IN ({','.join(['?'] * len(cats))}))"
+                )
+                params.extend(cats)
+            elif key == "year_min":
+                clauses.append("year >= ?")
+                params.append(int(value))
+            elif key == "year_max":
+                clauses.append("year <= ?")
+                params.append(int(value))
+            elif key == "authors":
+                # Author names are matched literally, so escape LIKE's wildcards
+                escaped = str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                clauses.append("authors LIKE ? ESCAPE '\\'")
+                params.append(f"%{escaped}%")
+            else:
+                raise ValueError(f"Unsupported search filter: {key}")
+        return " AND ".join(clauses) or None, params
+
+    def _search_filtered(self, queries, limit, condition, params, threads=0):
+        """
+        Filtered search. Selective filters are answered exactly over the
+        matching rows' vectors; broad ones over-fetch from the ANN index with
+        a bounded, doubling candidate count and fall back to the exact scan.
+        """
+        with self._read_cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM papers WHERE {condition}", params)
+            matching = cursor.fetchone()[0]
+        if matching <= FILTER_EXACT_MAX_ROWS:
+            return self._search_exact(queries, limit, condition, params)
+
+        selectivity = matching / max(len(self.index), 1)
+        count = min(len(self.index), int(np.ceil(2 * limit / selectivity)))
+        for _ in range(FILTER_MAX_ROUNDS):
+            cand_keys, cand_dists, cand_counts = self._search_candidates(queries, count, threads)
+            allowed = self._filter_ids(
+                {int(k) for q in range(len(queries)) for k in cand_keys[q, :cand_counts[q]]}, condition, params
+            )
+
+            keys = np.zeros((len(queries), limit), dtype=np.uint64)
+            distances = np.full((len(queries), limit), np.nan, dtype=np.float32)
+            counts = np.zeros(len(queries), dtype=np.int64)
+            for q in range(len(queries)):
+                hits = [i for i in range(cand_counts[q]) if int(cand_keys[q, i]) in allowed][:limit]
+                counts[q] = len(hits)
+                keys[q, :len(hits)] = cand_keys[q, hits]
+                distances[q, :len(hits)] = cand_dists[q, hits]
+
+            if (counts >= min(limit, matching)).all() or count >= len(self.index):
+                return keys, distances, counts
+            count = min(len(self.index), count * 2)
+
+        return self._search_exact(queries, limit, condition, params)
+
+    def _filter_ids(self, row_ids, condition, params):
+        """
+        Returns the subset of row_ids whose papers satisfy the filter condition.
+        """
+        row_ids = list(row_ids)
+        allowed = set()
+        # Long filter lists leave little room for ids; never let the chunk size reach zero
+        step = max(SQLITE_MAX_VARIABLES - len(params), 1)
+        with self._read_cursor() as cursor:
+            for start in range(0, len(row_ids), step):
+                chunk = row_ids[start:start + step]
+                cursor.execute(
+                    f"SELECT id FROM papers WHERE id IN ({','.join(['?'] * len(chunk))}) AND {condition}",
+                    chunk + params
+                )
+                allowed.update(row[0] for row in cursor.fetchall())
+        return allowed
+
+    def _search_exact(self, queries, limit, condition, params):
+        """
+        Exact cosine top-limit over the vectors of the papers matching condition.
+        """
+        with self._read_cursor() as cursor:
+            cursor.execute(
+                f"SELECT v.id, v.vector FROM paper_vectors v WHERE v.id IN (SELECT id FROM papers WHERE {condition})",
+                params
+            )
+            rows = cursor.fetchall()
+        keys = np.zeros((len(queries), limit), dtype=np.uint64)
+        distances = np.full((len(queries), limit), np.nan, dtype=np.float32)
+        counts = np.zeros(len(queries), dtype=np.int64)
+        if not rows:
+            return keys, distances, counts
+
+        row_ids = np.array([row[0] for row in rows], dtype=np.uint64)
+        matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32).reshape(len(rows), self.dim)
+        dists = cosine_distances(queries, matrix)
+        k = min(limit, len(rows))
+        top = np.argpartition(dists, k - 1, axis=1)[:, :k]
+        for q in range(len(queries)):
+            order = top[q][np.argsort(dists[q, top[q]])]
+            counts[q] = k
+            keys[q, :k] = row_ids[order]
+            distances[q, :k] = dists[q, order]
+        return keys, distances, counts
+
+    def _search_index(self, queries, count, threads=0):
+        """
+        Raw USearch batch search returning (keys, distances, counts) arrays.
+        """
+        with self._index_lock:
+            matches = self.index.search(self._encode(queries), count, threads=threads)
+        keys = np.asarray(matches.keys).reshape(len(queries), -1)
+        distances = np.asarray(matches.distances).reshape(len(queries), -1)
+        # A single-row batch comes back as plain Matches without counts
+        counts = np.asarray(getattr(matches, "counts", [keys.shape[1]])).reshape(-1)
+        return keys, distances, counts
+
+    def _search_b1(self, queries, limit, threads=0):
+        """
+        Two-stage search: Hamming candidates from the sign-bit index, reranked
+        by exact cosine against the stored float32 vectors.
+        """
+        cand_keys, _, cand_counts = self._search_index(queries, limit * self.oversample, threads)
+        stored = self._fetch_vectors({int(k) for q in range(len(queries)) for k in cand_keys[q, :cand_counts[q]]})
+
+        keys = np.zeros((len(queries), limit), dtype=np.uint64)
+        distances = np.full((len(queries), limit), np.nan, dtype=np.float32)
+        counts = np.zeros(len(queries), dtype=np.int64)
+        for q in range(len(queries)):
+            candidates = [int(k) for k in cand_keys[q, :cand_counts[q]] if int(k) in stored]
+            if not candidates:
+                continue
+            dists = cosine_distances(queries[q:q + 1], np.stack([stored[k] for k in candidates]))[0]
+            order = np.argsort(dists)[:limit]
+            counts[q] = len(order)
+            keys[q, :len(order)] = np.array(candidates, dtype=np.uint64)[order]
+            distances[q, :len(order)] = dists[order]
+        return keys, distances, counts
+
+    def _fetch_vectors(self, row_ids):
+        """
+        Maps row ids to their stored float32 vectors.
+        """
+        row_ids = list(row_ids)
+        vectors = {}
+        with self._read_cursor() as cursor:
+            for start in range(0, len(row_ids), SQLITE_MAX_VARIABLES):
+                chunk = row_ids[start:start + SQLITE_MAX_VARIABLES]
+                cursor.execute(
+                    f"SELECT id, vector FROM paper_vectors WHERE id IN ({','.join(['?'] * len(chunk))})",
+                    chunk
+                )
+                for row_id, blob in cursor.fetchall():
+                    vectors[row_id] = np.frombuffer(blob, dtype=np.float32)
+        return vectors
+
+    def _fetch_rows(self, row_ids, fields=None, key_column="id"):
+        """
+        Maps row ids (or arXiv IDs, with key_column="arxiv_id") to
+        (arxiv_id, metadata), reading only the requested columns.
+        The `extra` JSON remainder is decoded only when all fields are wanted.
+        """
+        keys = list(METADATA_COLUMNS) if fields is None else [f for f in fields if f in METADATA_COLUMNS]
+        columns = [METADATA_COLUMNS[key] for key in keys]
+        if fields is None:
+            columns.append("extra")
+
+        row_ids = list(row_ids)
+        rows = {}
+        with self._read_cursor() as cursor:
+            for start in range(0, len(row_ids), SQLITE_MAX_VARIABLES):
+                chunk = row_ids[start:start + SQLITE_MAX_VARIABLES]
+                cursor.execute(
+                    f"SELECT {', '.join([key_column, 'arxiv_id'] + columns)} FROM papers "
+                    f"WHERE {key_column} IN ({','.join(['?'] * len(chunk))})",
+                    chunk
+                )
+                for row in cursor.fetchall():
+                    metadata = {key: json.loads(value) if key in JSON_COLUMNS else value
+                                for key, value in zip(keys, row[2:]) if value is not None}
+                    if fields is None and row[-1]:
+                        metadata.update(json.loads(row[-1]))
+                    rows[row[0]] = (row[1], metadata)
+        return rows
+
+def evaluate_quantization(db_path="xaptns.db", dim=768, k=10, oversamples=(1, 5, 10, 20), num_queries=100, seed=0):
+    """
+    Measures recall@k of the i8 index and of b1 + exact rerank at each
+    oversampling factor, against exact cosine search over the stored vectors.
+    Queries are sampled from the corpus. Returns one row per configuration.
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    rows = conn.execute(
+        "SELECT p.arxiv_id, v.vector FROM papers p JOIN paper_vectors v ON v.id = p.id ORDER BY p.id"
+    ).fetchall()
+    conn.close()
+    if not rows:
+        return []
+
+    arxiv_ids = np.array([row[0] for row in rows])
+    matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32).reshape(len(rows), dim)
+    rng = np.random.default_rng(seed)
+    queries = matrix[rng.choice(len(matrix), size=min(num_queries, len(matrix)), replace=False)]
+    k = min(k, len(matrix))
+
+    exact = []
+    for start in range(0, len(queries), 64):
+        dists = cosine_distances(queries[start:start + 64], matrix)
+        top = np.argpartition(dists, k - 1, axis=1)[:, :k]
+        exact.extend(set(arxiv_ids[t]) for t in top)
+
+    def run(vindex):
+        started = time.perf_counter()
+        results = vindex.search_many(queries, limit=k)
+        elapsed = time.perf_counter() - started
+        return [set(r["arxiv_id"] for r in res) for res in results], elapsed * 1000 / len(queries)
+
+    def recall(found, truth):
+        return float(np.mean([len(f & t) / len(t) for f, t in zip(found, truth)]))
+
+    report = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # Read-only indexes are rebuilt in memory from the database and never saved
+        i8 = VectorIndex(dim=dim, db_path=db_path, index_path=os.path.join(tmp, "i8.usearch"),
+                         read_only=True, backend="hnsw")
+        i8_found, i8_ms = run(i8)
+        report.append({
+            "index": "i8", "oversample": None, "recall_exact": recall(i8_found, exact),
+            "recall_i8": 1.0, "ms_per_query": i8_ms, "memory_bytes": i8.index.memory_usage
+        })
+        i8.close()
+
+        b1 = VectorIndex(dim=dim, db_path=db_path, index_path=os.path.join(tmp, "b1.usearch"),
+                         read_only=True, quantization="b1", backend="hnsw")
+        for oversample in oversamples:
+            b1.oversample = oversample
+            found, ms = run(b1)
+            report.append({
+                "index": "b1", "oversample": oversample, "recall_exact": recall(found, exact),
+                "recall_i8": recall(found, i8_found), "ms_per_query": ms, "memory_bytes": b1.index.memory_usage
+            })
+        b1.close()
+    return report
+
 if __name__ == "__main__":
     vindex = VectorIndex(dim=4)
     v1 = np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
@@ -0,0 +1,219 @@
+import heapq
+import itertools
+import json
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from xaptns.search import VectorIndex
+
+MANIFEST_NAME = "manifest.json"
+
+class ShardedVectorIndex:
+    """
+    Partitions papers across several VectorIndex shard files and answers
+    queries by scatter-gather: every shard is searched in parallel and the
+    per-shard top-k lists are merged into a global top-k.
+
+    Shards are listed in a manifest inside shard_dir. With partition="hash"
+    new papers are spread by a stable hash of their arXiv ID; with
+    partition="year" each shard owns a [year_min, year_max] range. A paper
+    that already lives in a shard is always updated in place, so add_shard()
+    never requires rebuilding or rebalancing the existing shards.
+    """
+    def __init__(self, shard_dir="shards", num_shards=4, partition="hash", dim=768, max_workers=None, **index_kwargs):
+        self.shard_dir = shard_dir
+        self.dim = dim
+        self.index_kwargs = index_kwargs
+        os.makedirs(shard_dir, exist_ok=True)
+
+        self.manifest_path = os.path.join(shard_dir, MANIFEST_NAME)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            if partition not in ("hash", "year"):
+                raise ValueError(f"Unsupported partition: {partition}")
+            self.manifest = {"partition": partition, "shards": []}
+            for _ in range(num_shards if partition == "hash" else 1):
+                self.manifest["shards"].append({"name": self._next_name()})
+            self._save_manifest()
+
+        self.partition = self.manifest["partition"]
+        self.shards = [self._open_shard(spec) for spec in self.manifest["shards"]]
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _next_name(self):
+        return f"shard-{len(self.manifest['shards']):03d}"
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _open_shard(self, spec):
+        return VectorIndex(dim=self.dim, db_path=os.path.join(self.shard_dir, spec["name"] + ".db"), **self.index_kwargs)
+
+    def add_shard(self, year_min=None, year_max=None):
+        """
+        Opens a new, empty shard. Existing shards are left untouched; with
+        partition="year" the new shard takes papers in [year_min, year_max].
+        """
+        spec = {"name": self._next_name()}
+        if self.partition == "year":
+            spec.update({"year_min": year_min, "year_max": year_max})
+        self.manifest["shards"].append(spec)
+        self._save_manifest()
+        self.shards.append(self._open_shard(spec))
+        return self.shards[-1]
+
+    def _route(self, arxiv_id, metadata):
+        """
+        Picks the shard for a paper that is not stored anywhere yet. In year
+        mode the narrowest range holding the paper's year wins, so shards
+        added with explicit ranges take precedence over the open-ended one
+        created with the index; papers without a matching range go to the
+        open-ended shards.
+        """
+        candidates = range(len(self.shards))
+        if self.partition == "year":
+            specs = self.manifest["shards"]
+            if metadata and metadata.get("year") is not None:
+                year = int(metadata["year"])
+                matching = [i for i, spec in enumerate(specs)
+                            if (spec.get("year_min") is None or year >= spec["year_min"])
+                            and (spec.get("year_max") is None or year <= spec["year_max"])]
+                if matching:
+                    def span(i):
+                        lo, hi = specs[i].get("year_min"), specs[i].get("year_max")
+                        return float("inf") if lo is None or hi is None else hi - lo
+                    # Narrowest range first; among equals, the most recently added shard
+                    return min(matching, key=lambda i: (span(i), -i))
+            open_ended = [i for i, spec in enumerate(specs)
+                          if spec.get("year_min") is None and spec.get("year_max") is None]
+            candidates = open_ended or candidates
+        return candidates[zlib.crc32(arxiv_id.encode("utf-8")) % len(candidates)]
+
+    def _locate(self, arxiv_ids):
+        """
+        Maps each already-stored arXiv ID to the shard holding it.
+        """
+        located = {}
+        for i, shard in enumerate(self.shards):
+            for aid in shard.contains(arxiv_ids):
+                located.setdefault(aid, i)
+        return located
+
+    def contains(self, arxiv_ids):
+        """
+        Returns the subset of arxiv_ids stored in any shard.
+        """
+        return set(self._locate(list(arxiv_ids)))
+
+    def add(self, arxiv_id, vector, metadata=None):
+        """
+        Adds a vector to the shard that owns the paper.
+        """
+        vector_flat = vector.flatten().astype(np.float32)
+        self.add_many([arxiv_id], vector_flat.reshape(1, -1), [metadata])
+
+    def add_many(self, arxiv_ids, vectors, metadatas=None, threads=0):
+        """
+        Groups the batch by shard and bulk-adds each group. Returns True
+        only if every group was stored.
+        """
+        arxiv_ids = list(arxiv_ids)
+        if not arxiv_ids:
+            return True
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(arxiv_ids), self.dim)
+        if metadatas is None:
+            metadatas = [None] * len(arxiv_ids)
+
+        located = self._locate(arxiv_ids)
+        groups = {}
+        for pos, (aid, meta) in enumerate(zip(arxiv_ids, metadatas)):
+            shard = located[aid] if aid in located else self._route(aid, meta)
+            groups.setdefault(shard, []).append(pos)
+
+        stored = True
+        for i, positions in groups.items():
+            stored = self.shards[i].add_many(
+                [arxiv_ids[p] for p in positions], vectors[positions],
+                [metadatas[p] for p in positions], threads=threads
+            ) and stored
+        return stored
+
+    def _scatter(self, method, *args, **kwargs):
+        """
+        Calls method on every shard in parallel and returns the per-shard results.
+        """
+        return list(self.executor.map(lambda shard: getattr(shard, method)(*args, **kwargs), self.shards))
+
+    def search(self, vector, limit=10, fields=None, where=None):
+        """
+        Searches for the nearest neighbors across all shards.
+        """
+        vector_flat = vector.flatten().astype(np.float32)
+        return self.search_many(vector_flat.reshape(1, -1), limit=limit, fields=fields, where=where)[0]
+
+    def search_many(self, vectors, limit=10, threads=0, fields=None, where=None):
+        """
+        Scatter-gather batch search with the same result shape as
+        VectorIndex.search_many: each shard returns its own top-limit per
+        query, and the sorted lists are merged into the global top-limit.
+        """
+        queries = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        per_shard = self._scatter("search_many", queries, limit=limit, threads=threads, fields=fields, where=where)
+        return [
+            list(itertools.islice(heapq.merge(*[shard[q] for shard in per_shard], key=lambda r: r["distance"]), limit))
+            for q in range(len(queries))
+        ]
+
+    def get_vectors(self, arxiv_ids):
+        """
+        Returns {arxiv_id: float32 vector} gathered from every shard.
+        """
+        arxiv_ids = list(arxiv_ids)
+        vectors = {}
+        for found in self._scatter("get_vectors", arxiv_ids):
+            vectors.update(found)
+        return vectors
+
+    def get_metadata(self, arxiv_ids, fields=None):
+        """
+        Returns {arxiv_id: metadata dict} gathered from every shard.
+        """
+        arxiv_ids = list(arxiv_ids)
+        metadata = {}
+        for found in self._scatter("get_metadata", arxiv_ids, fields=fields):
+            metadata.update(found)
+        return metadata
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def flush(self):
+        self._scatter("flush")
+
+    def save(self):
+        self._scatter("save")
+
+    def close(self):
+        """
+        Saves and closes every shard.
+        """
+        self._scatter("close")
+        self.executor.shutdown()
+
+if __name__ == "__main__":
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        sharded = ShardedVectorIndex(shard_dir=tmp, num_shards=3, dim=4)
+        rng = np.random.default_rng(0)
+        sharded.add_many([f"paper{i}" for i in range(30)], rng.random((30, 4)), [{"title": f"Paper {i}"} for i in range(30)])
+        sharded.add_shard()
+        print(f"Shard sizes: {[len(s) for s in sharded.shards]}")
+        for res in sharded.search(np.array([1.0, 0.0, 0.0, 0.0]), limit=3):
+            print(f"Found {res['arxiv_id']} ({res['metadata']['title']}) with distance {res['distance']:.4f}")
+        sharded.close()